@@ -4,7 +4,8 @@ import torch
 import numpy as np
 
 from agent import Agent
-from model import Model, AdvancedModel
+import returns
+from model import Model, AdvancedModel, SharedModel
 
 
 class ActorCritic(Agent):
@@ -12,7 +13,12 @@ class ActorCritic(Agent):
         Agent.__init__(self, args)
 
     def create_model(self):
-        if self.args.algorithm in ["appo", "aa2c"]:
+        if self.args.network == "shared":
+            # the body is shared by the actor with mean and std head and the critic
+            if self.args.algorithm not in ["appo", "aa2c"]:
+                raise Exception("--network shared is only available for appo and aa2c")
+            model = SharedModel(self.args)
+        elif self.args.algorithm in ["appo", "aa2c"]:
             model = AdvancedModel(self.args)
         else:
             model = Model(self.args)
@@ -31,27 +37,33 @@ class ActorCritic(Agent):
             noise *= 0.9999 ** self.args.episode
         return noise * entropy
 
-    def get_advantage(self, states, next_states, actions, dones, discounted_return):
-        # Evaluate state and actions
-        V, _, _ = self.model.evaluate(states, actions)
+    def get_advantage(self, values, next_values, rewards, dones, discounted_return):
+        with self.args.timers.phase("Advantage"):
+            return self.compute_advantage(values, next_values, rewards, dones, discounted_return)
 
-        has_next = torch.logical_xor(dones, torch.ones_like(dones, device=self.args.device)) 
+    def compute_advantage(self, values, next_values, rewards, dones, discounted_return):
+        # values were recorded during rollout, so the model is not evaluated again
+        has_next = 1 - dones
 
-        # Calculate Advantage ( reinforce | temporal | advantage )
-        if self.args.advantage == "reinforce":
+        # Calculate Advantage ( reinforce | temporal | advantage | gae )
+        if self.args.gae_lambda > 0:
+            # Scan the trajectory of every environment separately
+            # dones of the batch are the terminals, the trajectories also end at truncations and the end of the batch
+            unflatten = self.buffer.unflatten
+            cuts = torch.from_numpy(self.buffer.dones[:self.buffer.t]).to(dones.device)
+            A = returns.gae(unflatten(rewards), unflatten(values), unflatten(next_values), cuts,
+                            self.args.gamma, self.args.gae_lambda, unflatten(dones))
+            A = self.buffer.flatten(A)
+        elif self.args.advantage == "reinforce":
             A = discounted_return
         elif self.args.advantage == "temporal":
-            V_next, _, _ = self.model.evaluate(next_states, actions)
-            A = discounted_return + V_next.detach() * self.args.gamma * has_next - V.detach()
+            A = discounted_return + next_values * self.args.gamma * has_next - values
         else:
-            A = discounted_return - V.detach()
-
-        if self.args.gae_lambda > 0:
-            A = self.discount(A, self.args.gamma * self.args.gae_lambda)
+            A = discounted_return - values
 
         if self.args.normalize == "advantage":
             # Normalize Advantages (Trick: makes PPO more stable)
             # Subtracting 1e-10, so there will be no possibility of dividing by 0
             A = (A - A.mean()) / (A.std() + 1e-10)
 
-        return A
\ No newline at end of file
+        return A
@@ -3,11 +3,20 @@ from abc import ABC
 import torch
 import numpy as np
 
+from buffer import RolloutBuffer
+import distributed
+import returns
+
 class Agent(ABC):
     def __init__(self, args):
         self.args = args 
 
         self.mse = torch.nn.MSELoss()
+
+        self.buffer = None
+
+        # states and episode information of the environments at the end of the last fixed horizon batch
+        self.carry = None
     
     def get_action(self, state):
         #return action, log_prob
@@ -19,15 +28,51 @@ class Agent(ABC):
     def update(self, state, action, reward, next_state, done):
         pass
 
+    def get_layout(self):
+        # empty tensors with the shapes of the samples update_model is called with
+        states  = torch.zeros(0, self.args.state_dim)
+        actions = torch.zeros(0, self.args.act_dim)
+        return [states, actions] + [torch.zeros(0) for _ in range(4)]
+
+    def shard(self, size, *tensors):
+        # with data parallel learners every process updates on an equal part of the first size samples
+        world_size = distributed.get_world_size()
+        if world_size == 1:
+            return tensors
+        return distributed.scatter(self.args.episode, size // world_size, tensors)
+
+    def create_buffer(self):
+        env = self.args.env
+        if self.args.fixed_horizon:
+            # every environment makes the same number of steps
+            if self.args.batch_size % env.num_envs != 0:
+                raise Exception("batch_size has to be a multiple of num_envs with --fixed_horizon")
+            return RolloutBuffer(self.args.batch_size // env.num_envs, env.num_envs, self.args.state_dim, self.args.act_dim)
+
+        # room for the batch plus the overshoot of the last episodes
+        capacity = int(np.ceil(self.args.batch_size / env.num_envs)) + max(self.args.max_step, 1)
+        return RolloutBuffer(capacity, env.num_envs, self.args.state_dim, self.args.act_dim)
+
     def rollout(self):
-        
-        # Batch data
-        states      = []
-        next_states = []
-        actions     = []
-        log_probs   = []
-        rewards     = []
-        dones       = []
+        # Batch data is written in place into a preallocated buffer
+        if self.buffer is None:
+            self.buffer = self.create_buffer()
+
+        sum_rewards = self.collect(self.model, self.buffer)
+        batch = self.get_batch(self.buffer, sum_rewards)
+
+        # steps of the batch, the samplers count theirs when the learner gets the batch
+        self.args.episode += len(batch[0])
+        return batch
+
+    def collect(self, model, buffer):
+        # steps the environments of args.env until the buffer holds batch_size steps, returns the episode rewards
+        if self.args.fixed_horizon:
+            return self.collect_horizon(model, buffer)
+
+        env = self.args.env
+        timers = self.args.timers
+        buffer.reset(env.reset())
 
         # Number of timesteps run so far in this batch
         t = 0
@@ -35,71 +80,131 @@ class Agent(ABC):
         # Sum of rewards achieved so far
         sum_rewards = []
 
+        # Episode information of every environment
+        ep_t      = np.zeros(env.num_envs, dtype=int)
+        ep_reward = np.zeros(env.num_envs)
+
+        # Environments which still run an episode of this batch
+        active = np.arange(env.num_envs)
+
         # default 4800
-        while t < self.args.batch_size:
-            
-            state = self.args.env.reset()
-            done = False
-
-            ep_t = 0
-            ep_reward = 0
-            while True:
-
-                # Increment timesteps for this batch
-                t += 1
-                ep_t += 1
-                self.args.episode += 1
-                
-                # Get action 
-                action, log_prob = self.model.get_action(state)
-                
-                # Execute step
-                next_state, reward, done, _ = self.args.env.step(action)
-
-                # Accumulate reward
-                ep_reward += reward
-
-                # Collect observation (state), reward, action, and log prob
-                states.append(state)
-                next_states.append(next_state)
-                rewards.append(reward)
-                actions.append(action)
-                log_probs.append(log_prob)
-
-                state = next_state
-
-                if done or (self.args.max_step > 0 and ep_t >= self.args.max_step):
-                    dones.append(True)
-                    # Add summed rewards to list
-                    sum_rewards.append(ep_reward)
-                    break
+        while len(active) > 0:
+
+            # Increment timesteps for this batch
+            t += len(active)
+            ep_t[active] += 1
+
+            # Get actions and value estimates of all active environments in a single forward pass
+            with timers.phase("Inference"):
+                action, log_prob, value = model.act(buffer.get_states(active))
+
+            # Execute step
+            with timers.phase("Env Step"):
+                next_state, reward, done, truncated = env.step(action, active)
+
+            # Accumulate reward
+            ep_reward[active] += reward
+
+            # Episodes end on done or after max_step steps, dones of time limits are no terminals
+            terminal = done & ~truncated
+            if self.args.max_step > 0:
+                done = done | (ep_t[active] >= self.args.max_step)
+
+            # Collect observation (state), reward, action, log prob and value
+            with timers.phase("Buffer"):
+                buffer.add(active, action, log_prob.cpu().numpy(), value.cpu().numpy(), reward, next_state, done,
+                           terminal)
+
+            finished = active[done]
+            if len(finished) > 0:
+                # Add summed rewards to list
+                sum_rewards.extend(ep_reward[finished])
+
+                # Start new episodes until the batch is full
+                if t < self.args.batch_size:
+                    with timers.phase("Env Step"):
+                        reset_states = env.reset(finished)
+                    buffer.restart(finished, reset_states)
+                    ep_t[finished] = 0
+                    ep_reward[finished] = 0
                 else:
-                    dones.append(False)
-        
-        # calculate discounted return
-        discounted_return = self.discount(rewards, dones, self.args.gamma)
-
-        # Normalizing the rewards:
-        if self.args.normalize == "reward":
-            discounted_return = (discounted_return - discounted_return.mean()) / (discounted_return.std() + 1e-5)
-
-        # Reshape data as tensors
-        states      = torch.tensor(states,      dtype=torch.float, device=self.args.device)
-        next_states = torch.tensor(next_states, dtype=torch.float, device=self.args.device)
-        actions     = torch.tensor(actions,     dtype=torch.float, device=self.args.device)
-        log_probs   = torch.tensor(log_probs,   dtype=torch.float, device=self.args.device)
-        rewards     = torch.tensor(rewards,     dtype=torch.float, device=self.args.device)
-        dones       = torch.tensor(dones,       dtype=torch.float, device=self.args.device)
+                    active = active[~done]
+
+        self.bootstrap(model, buffer)
+        return sum_rewards
+
+    def collect_horizon(self, model, buffer):
+        # Every environment makes batch_size / num_envs steps, unfinished episodes continue
+        # in the next batch and their return is bootstrapped with the critic
+        env = self.args.env
+        timers = self.args.timers
+
+        if self.carry is None:
+            self.carry = env.reset(), np.zeros(env.num_envs, dtype=int), np.zeros(env.num_envs)
+        states, ep_t, ep_reward = self.carry
+        buffer.reset(states)
+
+        sum_rewards = []
+        indices = np.arange(env.num_envs)
+        for _ in range(self.args.batch_size // env.num_envs):
+            ep_t += 1
+
+            with timers.phase("Inference"):
+                action, log_prob, value = model.act(buffer.get_states(indices))
+
+            with timers.phase("Env Step"):
+                next_state, reward, done, truncated = env.step(action, indices)
+            ep_reward += reward
+
+            # time limits of the environment and max_step truncate episodes without a terminal
+            terminal = done & ~truncated
+            if self.args.max_step > 0:
+                done = done | (ep_t >= self.args.max_step)
+
+            with timers.phase("Buffer"):
+                buffer.add(indices, action, log_prob.cpu().numpy(), value.cpu().numpy(), reward, next_state, done,
+                           terminal)
+
+            finished = indices[done]
+            if len(finished) > 0:
+                sum_rewards.extend(ep_reward[finished])
+                with timers.phase("Env Step"):
+                    reset_states = env.reset(finished)
+                buffer.restart(finished, reset_states)
+                ep_t[finished] = 0
+                ep_reward[finished] = 0
+
+        self.bootstrap(model, buffer)
+        self.carry = buffer.states[buffer.t].copy(), ep_t, ep_reward
+        return sum_rewards
+
+    def bootstrap(self, model, buffer):
+        # value of the states after truncated episodes and after the last step of the batch
+        steps, envs, next_states = buffer.truncate()
+        with self.args.timers.phase("Inference"):
+            buffer.bootstrap[:buffer.t] = 0
+            if len(steps) > 0:
+                buffer.bootstrap[steps, envs] = model.value(next_states).cpu().numpy()
+
+    def get_batch(self, buffer, sum_rewards):
+        # flat batch of the collected trajectories
+        with self.args.timers.phase("Buffer"):
+            # calculate discounted return for every environment
+            buffer.finish()
+            discounted_return = self.discount(buffer.rewards[:buffer.t], buffer.dones[:buffer.t], self.args.gamma,
+                                              buffer.bootstrap[:buffer.t])
+            discounted_return = torch.from_numpy(buffer.flatten(discounted_return)).to(self.args.device)
+
+            # Normalizing the rewards:
+            if self.args.normalize == "reward":
+                discounted_return = (discounted_return - discounted_return.mean()) / (discounted_return.std() + 1e-5)
+
+            # Tensors share the memory of the buffer
+            states, next_states, actions, log_probs, values, next_values, rewards, dones = buffer.get(self.args.device)
 
         # Return batch data
-        return states, next_states, actions, log_probs, rewards, dones, sum_rewards, discounted_return
-
-    def discount(self, data, dones, discount):
-        running = 0
-        discounted = torch.zeros(len(data), dtype=torch.float, device=self.args.device)
-        for i in reversed(range(len(data))):
-            if dones[i]:
-                running = 0
-            running = data[i] + discount * running
-            discounted[i] = running
-        return discounted
\ No newline at end of file
+        return states, next_states, actions, log_probs, values, next_values, rewards, dones, sum_rewards, discounted_return
+
+    def discount(self, data, dones, discount, bootstrap=None):
+        # data and dones are [time] or [time, env] arrays
+        return returns.discount(data, dones, discount, bootstrap)
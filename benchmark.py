@@ -0,0 +1,401 @@
+import subprocess
+import argparse
+import tempfile
+import json
+import time
+import sys
+import os
+
+import numpy as np
+import torch
+
+import commandline
+import environment
+import returns
+import timing
+import distributed
+import policy
+from ppo import PPO
+from a2c import A2C
+
+
+# algorithm and network of Model, AdvancedModel and SharedModel
+MODELS = [("ppo", "separate"), ("appo", "separate"), ("appo", "shared")]
+
+
+def str2list(s):
+    return list(map(int, s.split()))
+
+
+def measure(function, repeats):
+    # best time of several runs in seconds
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def reference_discount(data, dones, discount):
+    # element wise loop used by Agent.discount before the vectorized scan
+    running = 0
+    discounted = torch.zeros(len(data), dtype=torch.float)
+    for i in reversed(range(len(data))):
+        if dones[i]:
+            running = 0
+        running = data[i] + discount * running
+        discounted[i] = running
+    return discounted
+
+
+def create_trajectories(batch_size, max_step, seed=0):
+    rng = np.random.RandomState(seed)
+    rewards = rng.randn(batch_size).astype(np.float32)
+    values  = rng.randn(batch_size + 1).astype(np.float32)
+    dones   = np.zeros(batch_size, dtype=np.float32)
+    ends    = np.cumsum(rng.randint(1, max_step + 1, size=batch_size)) - 1
+    dones[ends[ends < batch_size]] = 1
+    dones[-1] = 1
+    return rewards, values[:-1], values[1:], dones
+
+
+def benchmark_discount(args):
+    # the loops are checked against the scan in tests/test_returns.py
+    rewards, values, next_values, dones = create_trajectories(args.batch_size, args.max_step)
+
+    # the [time, env] layout scans all environments at once
+    layout = (args.batch_size // args.num_envs, args.num_envs)
+    size = layout[0] * layout[1]
+    rewards_2d, dones_2d = rewards[:size].reshape(layout), dones[:size].reshape(layout)
+
+    rewards_list, dones_list = rewards.tolist(), dones.tolist()
+    results = {
+        "loop":         measure(lambda: reference_discount(rewards_list, dones_list, args.gamma), args.repeats),
+        "numpy":        measure(lambda: returns.discount(rewards, dones, args.gamma), args.repeats),
+        "torch":        measure(lambda: returns.discount(torch.from_numpy(rewards), torch.from_numpy(dones),
+                                                         args.gamma), args.repeats),
+        "numpy [T, N]": measure(lambda: returns.discount(rewards_2d, dones_2d, args.gamma), args.repeats),
+        "gae":          measure(lambda: returns.gae(rewards, values, next_values, dones, args.gamma,
+                                                    args.gae_lambda), args.repeats),
+    }
+    for name, seconds in results.items():
+        print("\t{: <14} {: >10.3f} ms".format(name, seconds * 1000))
+    return results
+
+
+def benchmark_distribution(args):
+    from torch.distributions import MultivariateNormal, Normal, Independent
+
+    torch.manual_seed(0)
+    mean    = torch.tanh(torch.randn(args.batch_size, args.act_dim))
+    var     = torch.nn.functional.softplus(torch.randn(args.batch_size, args.act_dim))
+    actions = mean + var.sqrt() * torch.randn(args.batch_size, args.act_dim)
+
+    def full():
+        dist = MultivariateNormal(mean, torch.diag_embed(var))
+        return dist.log_prob(actions), dist.entropy()
+
+    def diagonal():
+        dist = Independent(Normal(mean, var.sqrt()), 1)
+        return dist.log_prob(actions), dist.entropy()
+
+    # the log probs and entropy of both paths are compared in tests/test_distribution.py
+    results = {
+        "multivariate": measure(full, args.repeats),
+        "diagonal":     measure(diagonal, args.repeats),
+    }
+    for name, seconds in results.items():
+        print("\t{: <14} {: >10.3f} ms".format(name, seconds * 1000))
+    return results
+
+
+def create_agent(args, algorithm, hidden_units, mini_batch_size, env=None, adam="default", network="separate"):
+    # agent with the default settings of the trainer, synthetic dimensions unless an environment is given
+    agent_args = commandline.collect_arguments([])
+    agent_args.algorithm       = algorithm
+    agent_args.hidden_units    = hidden_units
+    agent_args.mini_batch_size = mini_batch_size
+    agent_args.adam            = adam
+    agent_args.network         = network
+    agent_args.batch_size      = args.batch_size
+    agent_args.max_step        = args.max_step
+    agent_args.gamma           = args.gamma
+    agent_args.device          = torch.device("cpu")
+    agent_args.episode         = 0
+    agent_args.timers          = timing.Timers()
+    agent_args.env             = env
+    agent_args.fixed_horizon   = env is not None and env.num_envs > 1
+    if env is None:
+        agent_args.state_dim = args.state_dim
+        agent_args.act_dim   = args.act_dim
+    else:
+        agent_args.state_dim = env.observation_space.shape[0]
+        agent_args.act_dim   = env.action_space.shape[0]
+
+    torch.manual_seed(0)
+    np.random.seed(0)
+    if algorithm in ["ppo", "appo"]:
+        return PPO(agent_args)
+    return A2C(agent_args)
+
+
+def create_batch(agent, batch_size):
+    # batch in the layout returned by Agent.rollout
+    args = agent.args
+    rewards, _, _, dones = create_trajectories(batch_size, args.max_step)
+    states      = torch.randn(batch_size, args.state_dim)
+    next_states = torch.randn(batch_size, args.state_dim)
+    actions, log_probs, values = agent.model.act(states)
+    next_values = agent.model.value(next_states)
+    discounted_return = torch.from_numpy(returns.discount(rewards, dones, args.gamma))
+    return (states, next_states, torch.from_numpy(actions), log_probs, values, next_values,
+            torch.from_numpy(rewards), torch.from_numpy(dones), discounted_return)
+
+
+def benchmark_rollout(args):
+    env = environment.create_vector_env(args.env_name, args.num_envs, no_graphics=True)
+    results = {}
+    try:
+        for algorithm in args.algorithms:
+            agent = create_agent(args, algorithm, args.hidden_units[0], args.mini_batch_sizes[0], env)
+
+            # the first rollout allocates the buffer
+            agent.rollout()
+            steps = []
+            seconds = measure(lambda: steps.append(len(agent.rollout()[0])), args.repeats)
+
+            # seconds per environment step
+            results[algorithm] = seconds / min(steps)
+            print("\t{: <14} {: >10.0f} steps/s".format(algorithm, 1 / results[algorithm]))
+    finally:
+        env.close()
+    return results
+
+
+def benchmark_action(args):
+    # latency of a single policy query, batch size 1 is the latency while testing
+    results = {}
+    for algorithm, network in MODELS:
+        for hidden_units in args.hidden_units:
+            model = create_agent(args, algorithm, hidden_units, args.mini_batch_sizes[0], network=network).model
+            for batch_size in args.action_batch_sizes:
+                states = np.random.randn(batch_size, args.state_dim).astype(np.float32)
+                name = "{} {} {}".format(type(model).__name__, "x".join(map(str, hidden_units)), batch_size)
+                results[name] = measure(lambda: model.get_action(states), args.repeats)
+                print("\t{: <26} {: >10.3f} ms".format(name, results[name] * 1000))
+    return results
+
+
+def benchmark_evaluate(args):
+    results = {}
+    for algorithm, network in MODELS:
+        for hidden_units in args.hidden_units:
+            model = create_agent(args, algorithm, hidden_units, args.mini_batch_sizes[0], network=network).model
+            for batch_size in args.mini_batch_sizes:
+                states  = torch.randn(batch_size, args.state_dim)
+                actions = torch.from_numpy(model.get_action(states)[0])
+                name = "{} {} {}".format(type(model).__name__, "x".join(map(str, hidden_units)), batch_size)
+                results[name] = measure(lambda: model.evaluate(states, actions), args.repeats)
+                print("\t{: <26} {: >10.3f} ms".format(name, results[name] * 1000))
+    return results
+
+
+def benchmark_learn(args):
+    # seconds per learn call, every call runs ppo_episodes * minibatches optimizer steps for ppo
+    results = {}
+    for algorithm in args.algorithms:
+        for hidden_units in args.hidden_units:
+            for mini_batch_size in args.mini_batch_sizes:
+                for adam, network in [(adam, network) for adam in args.adam for network in args.networks]:
+                    # only the actors with a std head have a shared body
+                    if network == "shared" and algorithm not in ["appo", "aa2c"]:
+                        continue
+
+                    agent = create_agent(args, algorithm, hidden_units, mini_batch_size, adam=adam, network=network)
+                    batch = create_batch(agent, args.batch_size)
+                    updates = agent.args.ppo_episodes * agent.minibatches if isinstance(agent, PPO) else 1
+
+                    name = "{} {} {}".format(algorithm, "x".join(map(str, hidden_units)), mini_batch_size)
+                    if adam != "default":
+                        name += " " + adam
+                    if network != "separate":
+                        name += " " + network
+                    results[name] = measure(lambda: agent.learn(*batch), args.repeats)
+                    print("\t{: <26} {: >10.3f} ms \t{: >10.0f} updates/s".format(
+                        name, results[name] * 1000, updates / results[name]))
+    return results
+
+
+def benchmark_scaling(args):
+    # seconds per learn call with the batch split over data parallel learner processes.
+    # Small nets and batches are faster with one learner, the gradients of every minibatch
+    # are all reduced, so the split only pays off if the backward pass outweighs that
+    results = {}
+    mini_batch_size = args.mini_batch_sizes[-1]
+    if max(args.learners) > os.cpu_count():
+        print("\tlearners beyond the {} cores of this machine share them".format(os.cpu_count()))
+    for algorithm in args.algorithms:
+        for hidden_units in args.hidden_units:
+            for batch_size in args.scaling_batch_sizes:
+                for learners in args.learners:
+                    agent = create_agent(args, algorithm, hidden_units, mini_batch_size)
+                    batch = create_batch(agent, batch_size)
+                    # every learner makes the optimizer steps of the whole batch on its shard
+                    updates = agent.args.ppo_episodes * (batch_size // mini_batch_size) if isinstance(agent, PPO) else 1
+                    if learners > 1:
+                        distributed.start(agent, learners)
+                    try:
+                        seconds = measure(lambda: agent.learn(*batch), args.repeats)
+                    finally:
+                        distributed.stop()
+
+                    name = "{} {} {} steps {} learners".format(
+                        algorithm, "x".join(map(str, hidden_units)), batch_size, learners)
+                    results[name] = seconds
+                    print("\t{: <40} {: >10.3f} ms \t{: >10.0f} updates/s".format(
+                        name, seconds * 1000, updates / seconds))
+    return results
+
+
+def measure_policy(args, algorithm, path):
+    # latency of a single state, the parity of the export is checked in tests/test_policy.py
+    results = {}
+    model = create_agent(args, algorithm, args.hidden_units[0], args.mini_batch_sizes[0]).model
+    policy.export_model(model, path)
+    runtime = policy.NumpyPolicy(path, seed=0)
+
+    state = np.random.randn(1, args.state_dim).astype(np.float32)
+    name = type(model).__name__
+    results[name + " torch"] = measure(lambda: model.get_action(state), args.repeats)
+    results[name + " numpy"] = measure(lambda: runtime.act(state), args.repeats)
+    results[name + " numpy deterministic"] = measure(lambda: runtime.act(state, deterministic=True), args.repeats)
+    return results
+
+
+def benchmark_policy(args):
+    # latency of the torch model and the numpy runtime
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for algorithm in ["ppo", "appo"]:
+            results.update(measure_policy(args, algorithm, os.path.join(folder, "policy.npz")))
+    for name, seconds in results.items():
+        print("\t{: <34} {: >10.3f} ms".format(name, seconds * 1000))
+    return results
+
+
+STARTUP_SNIPPET = """
+import time, json
+start = time.perf_counter()
+import numpy as np
+import main, environment
+{imports}
+imported = time.perf_counter()
+{create}
+state = env.reset()
+env.step({action})
+stepped = time.perf_counter()
+env.close()
+print(json.dumps({{"import": imported - start, "first step": stepped - start}}))
+"""
+
+STARTUP_MODES = {
+    "test":    ("", "env = environment.make_env({env_name!r})",
+                "env.action_space.sample()"),
+    "train":   ("", "env = environment.create_vector_env({env_name!r}, {num_envs}, no_graphics=True)",
+                "np.array([env.action_space.sample() for _ in range(env.num_envs)])"),
+    "subproc": ("", "env = environment.create_vector_env({env_name!r}, {num_envs}, no_graphics=True, backend='subproc')",
+                "np.array([env.action_space.sample() for _ in range(env.num_envs)])"),
+    "tuning":  ("from ray import tune", "env = environment.create_vector_env({env_name!r}, {num_envs}, no_graphics=True)",
+                "np.array([env.action_space.sample() for _ in range(env.num_envs)])"),
+}
+
+
+def benchmark_startup(args):
+    # time to the first environment step of every mode, measured in a fresh interpreter
+    results = {}
+    for mode, (imports, create, action) in STARTUP_MODES.items():
+        snippet = STARTUP_SNIPPET.format(imports=imports, create=create.format(**vars(args)), action=action)
+        process = subprocess.run([sys.executable, "-c", snippet], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            print("\t{: <14} failed: {}".format(mode, process.stderr.strip().splitlines()[-1]))
+            continue
+
+        results[mode] = json.loads(process.stdout.strip().splitlines()[-1])
+        print("\t{: <14} import {: >8.3f} s \tfirst step {: >8.3f} s".format(
+            mode, results[mode]["import"], results[mode]["first step"]))
+    return results
+
+
+def flatten_results(results, prefix=""):
+    # nested results as {"benchmark/measurement": seconds}
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten_results(value, prefix + name + "/"))
+        else:
+            flat[prefix + name] = value
+    return flat
+
+
+def compare(results, baseline):
+    # all measurements are seconds, a speedup above 1 is an improvement
+    results, baseline = flatten_results(results), flatten_results(baseline)
+    print("compare")
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        print("\t{: <40} {: >10.3f} ms {: >10.3f} ms \t{: >6.2f}x".format(
+            name, baseline[name] * 1000, seconds * 1000, baseline[name] / seconds))
+
+
+BENCHMARKS = {
+    "discount":     benchmark_discount,
+    "distribution": benchmark_distribution,
+    "rollout":      benchmark_rollout,
+    "action":       benchmark_action,
+    "evaluate":     benchmark_evaluate,
+    "learn":        benchmark_learn,
+    "scaling":      benchmark_scaling,
+    "policy":       benchmark_policy,
+    "startup":      benchmark_startup,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of Captain Wurmi')
+    parser.add_argument("benchmarks",           default=list(BENCHMARKS), nargs="*",    help="Benchmarks to run ({})".format(" | ".join(BENCHMARKS)))
+    parser.add_argument("--env_name",           default="numpy_worm",   type=str,       help="Environment of the rollout and startup benchmark")
+    parser.add_argument("--repeats",            default=10,             type=int,       help="Repetitions of every measurement")
+    parser.add_argument("--batch_size",         default=5000,           type=int,       help="timesteps_per_batch")
+    parser.add_argument("--max_step",           default=1000,           type=int,       help="max_timesteps_per_episode")
+    parser.add_argument("--state_dim",          default=64,             type=int,       help="Number of observations (the worm observes 64 values)")
+    parser.add_argument("--act_dim",            default=9,              type=int,       help="Number of actions (the worm has 9 joints)")
+    parser.add_argument("--num_envs",           default=8,              type=int,       help="Number of environments of the [T, N] layout")
+    parser.add_argument("--gamma",              default=0.995,          type=float,     help="Gamma")
+    parser.add_argument("--gae_lambda",         default=0.95,           type=float,     help="Lambda")
+    parser.add_argument("--algorithms",         default=["ppo", "appo", "a2c", "aa2c"], nargs="+", help="Algorithms of the rollout and learn benchmark")
+    parser.add_argument("--hidden_units",       default=[[64, 64], [256, 256]], nargs="+", type=str2list, help="Hidden units of the networks, every setting separated by space e.g. '64 64' '256 256'")
+    parser.add_argument("--mini_batch_sizes",   default=[32, 256],      nargs="+", type=int, help="mini batch sizes of the evaluate and learn benchmark")
+    parser.add_argument("--adam",               default=["default"],    nargs="+", type=str, help="Adam implementations of the learn benchmark (default | foreach | fused)")
+    parser.add_argument("--networks",           default=["separate", "shared"], nargs="+", type=str, help="Networks of the learn benchmark (separate | shared)")
+    parser.add_argument("--learners",           default=[1, 2, 4],      nargs="+", type=int, help="Process counts of the scaling benchmark")
+    parser.add_argument("--scaling_batch_sizes", default=[5000, 20000], nargs="+", type=int, help="Batch sizes of the scaling benchmark, large batches and nets are split over the learners")
+    parser.add_argument("--action_batch_sizes", default=[1, 8, 64, 512], nargs="+", type=int, help="Batch sizes of the get_action benchmark")
+    parser.add_argument("--output",             default=None,           type=str,       help="Store the results as json")
+    parser.add_argument("--baseline",           default=None,           type=str,       help="Compare the results with stored results")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.benchmarks:
+        print(name)
+        results[name] = BENCHMARKS[name](args)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            compare(results, json.load(file))
@@ -0,0 +1,158 @@
+import numpy as np
+import torch
+
+
+class RolloutBuffer:
+    def __init__(self, capacity, num_envs, state_dim, act_dim):
+        self.num_envs  = num_envs
+        self.state_dim = state_dim
+        self.act_dim   = act_dim
+
+        self.allocate(capacity)
+        self.reset(np.zeros((num_envs, state_dim), dtype=np.float32))
+
+    def allocate(self, capacity):
+        # Data is stored time major [time, env], the extra state row holds
+        # the observation following the last step of every environment
+        self.capacity  = capacity
+        self.states    = np.zeros((capacity + 1, self.num_envs, self.state_dim), dtype=np.float32)
+        self.actions   = np.zeros((capacity, self.num_envs, self.act_dim),       dtype=np.float32)
+        self.log_probs = np.zeros((capacity, self.num_envs),                     dtype=np.float32)
+        self.values    = np.zeros((capacity + 1, self.num_envs),                 dtype=np.float32)
+        self.rewards   = np.zeros((capacity, self.num_envs),                     dtype=np.float32)
+        self.dones     = np.zeros((capacity, self.num_envs),                     dtype=np.float32)
+
+        # dones end a trajectory, terminals are the dones which were not caused by a time limit or
+        # the end of the batch, the return of the other dones is bootstrapped with the value of the next state
+        self.terminals = np.zeros((capacity, self.num_envs),                     dtype=np.float32)
+        self.bootstrap = np.zeros((capacity, self.num_envs),                     dtype=np.float32)
+
+    def grow(self):
+        # only happens if episodes are not limited by max_step
+        old = self.states, self.actions, self.log_probs, self.values, self.rewards, self.dones, self.terminals, self.bootstrap
+        self.allocate(2 * self.capacity)
+        for new, data in zip([self.states, self.actions, self.log_probs, self.values, self.rewards, self.dones,
+                              self.terminals, self.bootstrap], old):
+            new[:len(data)] = data
+
+    def reset(self, states):
+        self.t = 0
+        self.lengths = np.zeros(self.num_envs, dtype=int)
+        self.states[0] = states
+
+        # observations which ended an episode and were replaced by a reset, key is (t, env)
+        self.terminal_states = {}
+
+    def get_states(self, indices):
+        return self.states[self.t, indices]
+
+    def add(self, indices, actions, log_probs, values, rewards, next_states, dones, terminals=None):
+        if self.t == self.capacity:
+            self.grow()
+
+        t = self.t
+        self.actions[t, indices]       = actions
+        self.log_probs[t, indices]     = log_probs
+        self.values[t, indices]        = values
+        self.rewards[t, indices]       = rewards
+        self.dones[t, indices]         = dones
+        self.terminals[t, indices]     = dones if terminals is None else terminals
+        self.states[t + 1, indices]    = next_states
+        self.lengths[indices]          = t + 1
+        self.t += 1
+
+    def restart(self, indices, states):
+        # keep the terminal observations before they are replaced by the new episodes
+        for env_id in indices:
+            self.terminal_states[(self.t - 1, env_id)] = self.states[self.t, env_id].copy()
+        self.states[self.t, indices] = states
+
+    def finish(self):
+        # rows after the last episode of an environment count as empty, finished steps
+        for env_id, length in enumerate(self.lengths):
+            self.rewards[length:self.t, env_id] = 0
+            self.dones[length:self.t, env_id]   = 1
+            self.terminals[length:self.t, env_id] = 1
+        return self.t
+
+    def truncate(self):
+        # ends the trajectories of all environments with their last step, returns the steps of
+        # trajectories which were cut without a terminal and the states following them
+        self.dones[self.lengths - 1, np.arange(self.num_envs)] = 1
+        steps, envs = np.nonzero((self.dones[:self.t] > 0) & (self.terminals[:self.t] == 0) & self.get_mask())
+        states = self.states[steps + 1, envs]
+        for i, key in enumerate(zip(steps, envs)):
+            if key in self.terminal_states:
+                states[i] = self.terminal_states[key]
+        return steps, envs, states
+
+    def get_trajectories(self):
+        # compact arrays of the collected steps, e.g. to send them to another process
+        return {
+            "states":          self.states[:self.t + 1],
+            "actions":         self.actions[:self.t],
+            "log_probs":       self.log_probs[:self.t],
+            "values":          self.values[:self.t + 1],
+            "rewards":         self.rewards[:self.t],
+            "dones":           self.dones[:self.t],
+            "terminals":       self.terminals[:self.t],
+            "bootstrap":       self.bootstrap[:self.t],
+            "lengths":         self.lengths,
+            "terminal_states": self.terminal_states,
+        }
+
+    def merge(self, parts):
+        # places the environments of several trajectories side by side, the buffer must have room for all of them
+        t = max(len(part["rewards"]) for part in parts)
+        if self.capacity < t:
+            self.allocate(t)
+        self.t = t
+        self.terminal_states = {}
+
+        offset = 0
+        for part in parts:
+            envs = slice(offset, offset + len(part["lengths"]))
+            for name in ["states", "actions", "log_probs", "values", "rewards", "dones", "terminals", "bootstrap"]:
+                data = part[name]
+                getattr(self, name)[:len(data), envs] = data
+            self.lengths[envs] = part["lengths"]
+            for (step, env_id), state in part["terminal_states"].items():
+                self.terminal_states[(step, env_id + offset)] = state
+            offset += len(part["lengths"])
+
+    def get_mask(self):
+        return np.arange(self.t)[:, None] < self.lengths[None, :]
+
+    def flatten(self, data):
+        # [time, env, ...] -> [time * env, ...] without copying if all environments have the same length
+        if np.all(self.lengths == self.t):
+            return data[:self.t].reshape((self.t * self.num_envs,) + data.shape[2:])
+        mask = self.get_mask()
+        if torch.is_tensor(data):
+            mask = torch.from_numpy(mask).to(data.device)
+        return data[:self.t][mask]
+
+    def unflatten(self, data):
+        # inverse of flatten for torch tensors, rows after the end of an environment are zero
+        if np.all(self.lengths == self.t):
+            return data.reshape((self.t, self.num_envs) + data.shape[1:])
+        full = torch.zeros((self.t, self.num_envs) + data.shape[1:], dtype=data.dtype, device=data.device)
+        full[torch.from_numpy(self.get_mask()).to(data.device)] = data
+        return full
+
+    def get_terminal_states(self):
+        # rows of the flat batch whose next state is an observation of terminal_states and these observations
+        if len(self.terminal_states) == 0:
+            return np.zeros(0, dtype=int), np.zeros((0, self.state_dim), dtype=np.float32)
+        rows = np.cumsum(self.get_mask()).reshape(self.t, self.num_envs) - 1
+        steps, envs = np.array(list(self.terminal_states.keys())).T
+        return rows[steps, envs], np.stack(list(self.terminal_states.values()))
+
+    def get(self, device):
+        # next states are the shifted states, the observations which ended an episode are kept in terminal_states,
+        # next values are the bootstrapped values of cut trajectories or the shifted values, dones are the terminals
+        next_values = np.where(self.dones[:self.t] > 0, self.bootstrap[:self.t], self.values[1:self.t + 1])
+
+        data = [self.states[:self.t], self.states[1:self.t + 1], self.actions, self.log_probs, self.values[:self.t],
+                next_values, self.rewards, self.terminals]
+        return [torch.from_numpy(self.flatten(x)).to(device) for x in data]
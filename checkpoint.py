@@ -0,0 +1,144 @@
+import collections
+import functools
+import threading
+import random
+import json
+import os
+
+import numpy as np
+import torch
+
+from metrics import METRICS_FILE
+
+
+def atomic_write(path, write):
+    # write into a temporary file and rename it, a crash never leaves a half written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_checkpoint(checkpoint_path, state, batch):
+    # the history is not stored again, the checkpoint references the rows of the metrics file
+    data = json.dumps({"metrics": METRICS_FILE, "batch": batch}).encode()
+
+    atomic_write(checkpoint_path + "_actor.nn",  lambda f: torch.save(state["actor"], f))
+    atomic_write(checkpoint_path + "_critic.nn", lambda f: torch.save(state["critic"], f))
+    atomic_write(checkpoint_path + "_data.json", lambda f: f.write(data))
+
+
+def get_numpy_state(rng):
+    # numpy state with types torch.load accepts
+    name, keys, position, has_gauss, cached_gaussian = rng.get_state()
+    return name, torch.from_numpy(keys.astype(np.int64)), position, has_gauss, cached_gaussian
+
+
+def set_numpy_state(rng, state):
+    name, keys, position, has_gauss, cached_gaussian = state
+    rng.set_state((name, keys.numpy().astype(np.uint32), position, has_gauss, cached_gaussian))
+
+
+def get_rng_state(env=None):
+    # random streams of python, numpy, torch and of environments with their own generator
+    state = {
+        "python": random.getstate(),
+        "numpy":  get_numpy_state(np.random),
+        "torch":  torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    if isinstance(getattr(env, "rng", None), np.random.RandomState):
+        state["env"] = get_numpy_state(env.rng)
+    return state
+
+
+def set_rng_state(state, env=None):
+    random.setstate(state["python"])
+    set_numpy_state(np.random, state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+    if "env" in state and isinstance(getattr(env, "rng", None), np.random.RandomState):
+        set_numpy_state(env.rng, state["env"])
+
+
+def write_resume(path, state):
+    atomic_write(path, lambda f: torch.save(state, f))
+
+
+def load_resume(path, device="cpu"):
+    return torch.load(path, map_location=device)
+
+
+class CheckpointWriter:
+    def __init__(self):
+        # writes waiting to be done, a newer save of the same path replaces the older one
+        self.pending = collections.OrderedDict()
+        self.writing = False
+        self.closed = False
+        self.error = None
+
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def save(self, model, checkpoint_path, batch):
+        self.check()
+
+        # snapshot of the weights, training continues while they are written
+        state = model.get_state()
+        self.put(checkpoint_path, functools.partial(write_checkpoint, checkpoint_path, state, batch))
+
+    def save_resume(self, model, path, progress):
+        # single file with everything needed to continue the run, taken after a finished batch
+        self.check()
+
+        state = model.get_resume_state()
+        state["progress"] = progress
+        state["rng"] = get_rng_state(model.args.env)
+        self.put(path, functools.partial(write_resume, path, state))
+
+    def put(self, path, write):
+        with self.condition:
+            self.pending[path] = write
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                _, write = self.pending.popitem(last=False)
+                self.writing = True
+
+            try:
+                write()
+            except Exception as e:
+                self.error = e
+
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def flush(self):
+        with self.condition:
+            while self.pending or self.writing:
+                self.condition.wait()
+        self.check()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.check()
@@ -1,11 +1,12 @@
 import argparse
 
-def collect_arguments():
-    def str2bool(s):
-        if s == False or s.lower() in ["false", "f", "0"]:
-            return False
-        return True
+def str2bool(s):
+    if s == False or s.lower() in ["false", "f", "0"]:
+        return False
+    return True
 
+
+def collect_arguments(arguments=None):
     def str2list(s):
         return list(map(int, s.split()))
     
@@ -18,13 +19,38 @@ def collect_arguments():
     parser.add_argument("-a", "--algorithm",    default="appo",         type=str,       help="Define the algorithm ppo | appo |a2c")
     parser.add_argument("-n", "--env_name",     default="static_worm",  type=str,       help="Define the environment")
     parser.add_argument("-t", "--tuning",       default=False,          type=str2bool,  help="Define if hyperparameter tuning should be used")
+    parser.add_argument("--scheduler",          default="none",         type=str,       help="Scheduler which stops bad trials during tuning (none | asha | hyperband | median)")
+    parser.add_argument("--grace_period",       default=1000,           type=int,       help="Episodes every trial runs before the scheduler may stop it")
+    parser.add_argument("--reduction_factor",   default=3,              type=int,       help="Reduction factor of asha and hyperband")
+    parser.add_argument("--tune_checkpoints",   default=10,             type=int,       help="The intervall of batches to store checkpoints for tune to resume trials")
     parser.add_argument("-i", "--interrupt",    default=False,          type=str2bool,  help="Define if the algorithm can be interrupted due to low std")
     parser.add_argument("-c", "--checkpoints",  default=20,             type=int,       help="The intervall of batches to store checkpoints of the net")
     parser.add_argument("-l", "--load",         default=None,           type=str,       help="Load the weights for the net from")
+    parser.add_argument("--seed",               default=None,           type=int,       help="Seed of python, numpy and torch")
+    parser.add_argument("-r", "--resume",       default=None,           type=str,       help="Continue a run with its settings, optimizer and random state e.g. run_<run_id>")
+    parser.add_argument("--mlflow_uri",         default=None,           type=str,       help="Track the metrics in mlflow, local file store (file:./mlruns) or tracking server uri")
+    parser.add_argument("--mlflow_experiment",  default="captain_wurmi", type=str,      help="Experiment of the mlflow runs")
+    parser.add_argument("--mlflow_interval",    default=10.,            type=float,     help="Seconds between two mlflow requests")
     parser.add_argument("-m", "--mode",         default="train",        type=str,       help='Mode to evaluate (train|test)')
+    parser.add_argument("--runtime",            default="torch",        type=str,       help="Act with the torch model or the exported numpy policy in test mode (torch | numpy)")
+    parser.add_argument("--deterministic",      default=False,          type=str2bool,  help="Act with the mean action of the numpy policy")
+    parser.add_argument("--float16",            default=False,          type=str2bool,  help="Export the numpy policy with float16 weights")
+    parser.add_argument("--num_envs",           default=1,              type=int,       help="Number of environments stepped in parallel during rollout")
+    parser.add_argument("--learners",           default=1,              type=int,       help="Number of processes which update the model on a shard of every batch, only faster with a free core per learner and large nets or batches (see benchmark.py scaling)")
+    parser.add_argument("--fixed_horizon",      default=None,           type=str2bool,  help="Collect exactly batch_size steps, unfinished episodes continue in the next batch (default: with more than one environment)")
+    parser.add_argument("--async_rollout",      default=False,          type=str2bool,  help="Collect the next batch with a policy snapshot while the learner trains")
+    parser.add_argument("--ray_workers",        default=0,              type=int,       help="Number of ray actors which collect the batch with num_envs environments each, 0 collects it in the trainer")
+    parser.add_argument("--ray_address",        default=None,           type=str,       help="Address of the ray cluster of the rollout workers, a local cluster is started by default")
+    parser.add_argument("--profile",            default="none",         type=str,       help="Profile a window of batches and store the traces in the run folder (none | torch | cprofile)")
+    parser.add_argument("--profile_start",      default=1,              type=int,       help="Batches before the profiled window")
+    parser.add_argument("--profile_batches",    default=3,              type=int,       help="Number of profiled batches")
+    parser.add_argument("--env_backend",        default="sync",         type=str,       help="Step the environments in the trainer, in worker processes or all agents of one unity scene (sync | subproc | unity)")
+    parser.add_argument("--worker_id",          default=0,              type=int,       help="Worker id (port offset) of the first unity environment")
+    parser.add_argument("--time_scale",         default=20.,            type=float,     help="Time scale of unity without graphics")
 
     # net
     parser.add_argument("--hidden_units",       default="64 64",        type=str2list,  help="Hidden units as list separated by single space e.g. '64 64'")
+    parser.add_argument("--network",            default="separate",     type=str,       help="Separate nets for actor and critic or one shared body with policy and value heads (separate | shared)")
     parser.add_argument("--activation",         default="Tanh",         type=str,       help="Define if hyperparamete training should be used (ReLU | Tanh | ...)")
 
     # hyperparameter
@@ -42,6 +68,15 @@ def collect_arguments():
     parser.add_argument("--noise_decay",        default="linear",       type=str,       help="Noise Decay Type (linear | geometric)")
     parser.add_argument("--normalize",          default="advantage",    type=str,       help="Define what should normalized")
     parser.add_argument("--advantage",          default="advantage",    type=str,       help="Choose the advantage function (reinforce | temporal | advantage)")
+    parser.add_argument("--adam",               default="default",      type=str,       help="Implementation of the adam update (default | foreach | fused)")
+    parser.add_argument("--value_coef",         default=0.5,            type=float,     help="Weight of the critic loss of the shared network")
     parser.add_argument("--max_grad_norm",      default=0,              type=float,     help="Maximum of gradient")
     
-    return parser.parse_args()
\ No newline at end of file
+    return parser.parse_args(arguments)
+
+
+def get_settings(args):
+    # arguments of the run without the objects created by trainable and the step counter,
+    # they are stored with the run and sent to the learner and rollout processes
+    return {name: value for name, value in vars(args).items()
+            if isinstance(value, (bool, int, float, str, list, type(None))) and name not in ["episode"]}
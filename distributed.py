@@ -0,0 +1,166 @@
+import multiprocessing as mp
+import argparse
+import socket
+import signal
+import math
+import os
+
+import torch
+import torch.distributed as dist
+
+import commandline
+from timing import Timers
+
+# commands of the trainer (rank 0) to the learner processes
+STOP, LEARN, SYNC = 0, 1, 2
+
+# learner processes of the trainer
+processes = []
+
+# threads of the trainer before they were divided between the processes
+threads = None
+
+
+def get_world_size():
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_world_size()
+    return 1
+
+
+def get_threads(world_size):
+    # the cores are divided between the processes
+    return max(1, (os.cpu_count() or 1) // world_size)
+
+
+def start(agent, world_size):
+    # the trainer is rank 0 and collects the batches, every rank updates on a shard of them
+    global processes, threads
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+
+    settings = commandline.get_settings(agent.args)
+
+    context = mp.get_context("spawn")
+    processes = [context.Process(target=learner, args=(rank, world_size, settings), daemon=True)
+                 for rank in range(1, world_size)]
+    for process in processes:
+        process.start()
+
+    threads = torch.get_num_threads()
+    torch.set_num_threads(get_threads(world_size))
+    dist.init_process_group("gloo", rank=0, world_size=world_size)
+    sync(agent.model)
+
+
+def stop():
+    global processes, threads
+    if get_world_size() > 1:
+        send_command(STOP)
+        dist.destroy_process_group()
+    for process in processes:
+        process.join()
+    processes = []
+
+    if threads is not None:
+        torch.set_num_threads(threads)
+        threads = None
+
+
+def send_command(command, episode=0, size=0):
+    dist.broadcast(torch.tensor([command, episode, size], dtype=torch.float64), 0)
+
+
+def receive_command():
+    command = torch.zeros(3, dtype=torch.float64)
+    dist.broadcast(command, 0)
+    return int(command[0]), int(command[1]), int(command[2])
+
+
+def sync(model):
+    # weights and adam moments of the trainer, e.g. after --load or --resume
+    if dist.get_rank() == 0:
+        send_command(SYNC)
+        dist.broadcast_object_list([model.get_resume_state()], 0)
+    else:
+        state = [None]
+        dist.broadcast_object_list(state, 0)
+        model.load_resume_state(state[0])
+
+
+def scatter(episode, size, tensors):
+    # sends size samples of every tensor to each rank and returns the shard of rank 0
+    send_command(LEARN, episode, size)
+    used = size * get_world_size()
+    widths = [math.prod(tensor.shape[1:]) for tensor in tensors]
+    packed = torch.cat([tensor[:used].reshape(used, -1).float().cpu() for tensor in tensors], 1)
+    shards = list(packed.split(size))
+    shard = torch.empty_like(shards[0])
+    dist.scatter(shard, shards, 0)
+    return unpack(shard, tensors, widths)
+
+
+def receive(size, tensors):
+    # shard of the packed batch, tensors are examples of the layout
+    widths = [math.prod(tensor.shape[1:]) for tensor in tensors]
+    shard = torch.empty(size, sum(widths))
+    dist.scatter(shard, None, 0)
+    return unpack(shard, tensors, widths)
+
+
+def unpack(shard, tensors, widths):
+    return [part.reshape(len(part), *tensor.shape[1:]).to(tensor.device, tensor.dtype)
+            for part, tensor in zip(shard.split(widths, 1), tensors)]
+
+
+def all_reduce_gradients(parameters):
+    # mean gradient of all ranks with a single all reduce
+    world_size = get_world_size()
+    if world_size == 1:
+        return
+
+    parameters = list(parameters)
+    for parameter in parameters:
+        if parameter.grad is None:
+            parameter.grad = torch.zeros_like(parameter)
+    flat = torch.cat([parameter.grad.reshape(-1) for parameter in parameters])
+    dist.all_reduce(flat)
+    flat /= world_size
+
+    offset = 0
+    for parameter in parameters:
+        parameter.grad.copy_(flat[offset:offset + parameter.numel()].view_as(parameter.grad))
+        offset += parameter.numel()
+
+
+def learner(rank, world_size, settings):
+    # learner process, updates the same model as the trainer on its shard of every batch
+    # the trainer handles KeyboardInterrupt and stops the learners
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from ppo import PPO
+    from a2c import A2C
+
+    torch.set_num_threads(get_threads(world_size))
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+    args = argparse.Namespace(**settings)
+    args.device = torch.device("cpu")
+    args.env = None
+    args.timers = Timers()
+    args.episode = 0
+    agent = PPO(args) if args.algorithm in ["ppo", "appo"] else A2C(args)
+
+    while True:
+        command, episode, size = receive_command()
+        if command == STOP:
+            break
+        elif command == SYNC:
+            sync(agent.model)
+        elif command == LEARN:
+            args.episode = episode
+            agent.update_model(*receive(size, agent.get_layout()))
+
+    dist.destroy_process_group()
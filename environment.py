@@ -1,29 +1,423 @@
-from mlagents_envs.environment import UnityEnvironment
-from gym_unity.envs import UnityToGymWrapper
-from mlagents_envs.side_channel.engine_configuration_channel import EngineConfigurationChannel
-import gym
-import os 
+from multiprocessing import shared_memory, resource_tracker
+import multiprocessing as mp
+import traceback
+import atexit
+import signal
+import numpy as np
+import functools
+import os
 
+import worm
+
+
+def load_unity_env(name, no_graphics=False, worker_id=0, time_scale=20.):
+    # unity is only imported for the worm environments
+    from mlagents_envs.environment import UnityEnvironment
+    from mlagents_envs.side_channel.engine_configuration_channel import EngineConfigurationChannel
 
-def load_env(name, no_graphics=False):
     file_name = os.path.abspath(os.path.join(__file__, os.pardir, "environments", name, "UnityEnvironment"))
 
     if no_graphics:
 
         engineConfigChannel = EngineConfigurationChannel()
-        unity_env = UnityEnvironment(file_name, no_graphics=no_graphics, side_channels=[engineConfigChannel])
-        engineConfigChannel.set_configuration_parameters(time_scale=20.)
+        unity_env = UnityEnvironment(file_name, worker_id=worker_id, no_graphics=no_graphics, side_channels=[engineConfigChannel])
+        engineConfigChannel.set_configuration_parameters(time_scale=time_scale)
     else:
-        unity_env = UnityEnvironment(file_name, no_graphics=no_graphics)
-    
-    env = UnityToGymWrapper(unity_env)
+        unity_env = UnityEnvironment(file_name, worker_id=worker_id, no_graphics=no_graphics)
+
+    return unity_env
+
+def load_env(name, no_graphics=False, worker_id=0, time_scale=20.):
+    from gym_unity.envs import UnityToGymWrapper
+
+    env = UnityToGymWrapper(load_unity_env(name, no_graphics, worker_id, time_scale))
 
     return env
 
 def create_gym_env(name):
+    import gym
+
     # Pendulum-v0
     #env = gym.make('MountainCarContinuous-v0')
     env = gym.make(name)
 
     # return env.env to avoid setting done in env.step() after 200 steps
     return env
+
+def make_env(name, no_graphics=False, worker_id=0, time_scale=20.):
+    if name in ["dynamic_worm", "static_worm"]:
+        return load_env(name=name, no_graphics=no_graphics, worker_id=worker_id, time_scale=time_scale)
+    elif name == "numpy_worm":
+        return worm.WormEnv(seed=worker_id)
+    return create_gym_env(name)
+
+def create_vector_env(name, num_envs, no_graphics=False, backend="sync", worker_id=0, time_scale=20.):
+    # the numpy worm steps all instances at once
+    if name == "numpy_worm" and backend == "sync":
+        return worm.BatchedWorm(num_envs, seed=worker_id)
+
+    # all worms of a single unity scene, the scene defines the number of environments
+    if backend == "unity":
+        return UnityVectorEnv(load_unity_env(name, no_graphics, worker_id, time_scale))
+
+    # every unity instance needs its own worker id (port)
+    env_fns = [functools.partial(make_env, name, no_graphics, worker_id + i, time_scale) for i in range(num_envs)]
+
+    if backend == "subproc":
+        return SubprocVectorEnv(env_fns)
+    elif backend == "sync":
+        return VectorEnv(env_fns)
+    raise NotImplementedError
+
+
+class VectorEnv:
+    def __init__(self, env_fns):
+        self.envs = [env_fn() for env_fn in env_fns]
+        self.num_envs = len(self.envs)
+
+        # all copies share the spaces of the first environment
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+        if hasattr(self.envs[0], "_max_episode_steps"):
+            self._max_episode_steps = self.envs[0]._max_episode_steps
+
+    def get_indices(self, indices):
+        return np.arange(self.num_envs) if indices is None else indices
+
+    def reset(self, indices=None):
+        return np.array([self.envs[i].reset() for i in self.get_indices(indices)], dtype=np.float32)
+
+    def step(self, actions, indices=None):
+        # step the selected environments, actions are ordered like the indices,
+        # truncated marks the dones which were caused by the time limit of gym's TimeLimit wrapper
+        states, rewards, dones, truncated = [], [], [], []
+        for i, action in zip(self.get_indices(indices), actions):
+            state, reward, done, info = self.envs[i].step(action)
+            states.append(state)
+            rewards.append(reward)
+            dones.append(done)
+            truncated.append(info.get("TimeLimit.truncated", False))
+        return (np.array(states, dtype=np.float32), np.array(rewards, dtype=float), np.array(dones, dtype=bool),
+                np.array(truncated, dtype=bool))
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+class ActionTuple:
+    # container of the actions with the attributes of mlagents_envs.base_env.ActionTuple,
+    # used for unity environments (e.g. fakes) on machines without mlagents_envs
+    def __init__(self, continuous=None, discrete=None):
+        self.continuous = continuous
+        self.discrete = discrete
+
+
+def get_action_tuple():
+    try:
+        from mlagents_envs.base_env import ActionTuple as UnityActionTuple
+        return UnityActionTuple
+    except ImportError:
+        return ActionTuple
+
+
+class UnityVectorEnv:
+    # Every agent of a unity behavior is one environment. All agents are stepped with a
+    # single set_actions / step / get_steps exchange instead of one unity process per worm.
+    # Unity restarts finished agents itself, so only a reset of all environments resets the scene.
+    def __init__(self, unity_env, action_tuple=None):
+        self.ActionTuple = action_tuple if action_tuple is not None else get_action_tuple()
+
+        self.env = unity_env
+        self.env.reset()
+        self.behavior_name = list(self.env.behavior_specs)[0]
+        spec = self.env.behavior_specs[self.behavior_name]
+
+        decision_steps, _ = self.env.get_steps(self.behavior_name)
+        self.num_envs = len(decision_steps)
+
+        # observations of all sensors are concatenated
+        state_dim = sum(int(np.prod(shape)) for shape in self.get_observation_shapes(spec))
+        self.observation_space = worm.Box(-np.inf, np.inf, (state_dim,))
+        self.action_space      = worm.Box(-1, 1, (spec.action_spec.continuous_size,))
+
+        self.states  = np.zeros((self.num_envs, state_dim), dtype=np.float32)
+        self.actions = np.zeros((self.num_envs, spec.action_spec.continuous_size), dtype=np.float32)
+
+        # first observation of the next episode of agents which were restarted by unity
+        self.next_states = np.zeros_like(self.states)
+        self.restarted   = np.zeros(self.num_envs, dtype=bool)
+
+        self.map_agents(decision_steps)
+
+    @staticmethod
+    def get_observation_shapes(spec):
+        # renamed in mlagents_envs 0.26
+        if hasattr(spec, "observation_specs"):
+            return [observation_spec.shape for observation_spec in spec.observation_specs]
+        return spec.observation_shapes
+
+    def get_observations(self, steps):
+        return np.concatenate([obs.reshape(len(steps), -1) for obs in steps.obs], 1)
+
+    def map_agents(self, decision_steps):
+        # environment index of every agent id
+        self.slots = {agent_id: i for i, agent_id in enumerate(decision_steps.agent_id)}
+        self.decision_ids = decision_steps.agent_id
+        self.states[:] = self.get_observations(decision_steps)
+        self.restarted[:] = False
+
+    def get_slots(self, agent_ids):
+        return np.array([self.slots[agent_id] for agent_id in agent_ids], dtype=int)
+
+    def get_indices(self, indices):
+        return np.arange(self.num_envs) if indices is None else indices
+
+    def reset(self, indices=None):
+        if indices is None:
+            self.env.reset()
+            decision_steps, _ = self.env.get_steps(self.behavior_name)
+            self.map_agents(decision_steps)
+            return self.states.copy()
+
+        # agents which were not finished by unity continue their episode
+        restarted = indices[self.restarted[indices]]
+        self.states[restarted] = self.next_states[restarted]
+        self.restarted[restarted] = False
+        return self.states[indices]
+
+    def step(self, actions, indices=None):
+        indices = self.get_indices(indices)
+
+        # inactive agents repeat their last action
+        self.actions[indices] = actions
+
+        rewards   = np.zeros(self.num_envs)
+        dones     = np.zeros(self.num_envs, dtype=bool)
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        received  = np.zeros(self.num_envs, dtype=bool)
+
+        # agents can skip decisions, unity is stepped until all of them requested one or finished
+        while not received.all():
+            if len(self.decision_ids) > 0:
+                actions = self.actions[self.get_slots(self.decision_ids)]
+                self.env.set_actions(self.behavior_name, self.ActionTuple(continuous=actions))
+            self.env.step()
+
+            decision_steps, terminal_steps = self.env.get_steps(self.behavior_name)
+
+            # the last observation of a finished episode is returned with done,
+            # episodes which reached the max step of the agent are interrupted
+            if len(terminal_steps) > 0:
+                slots = self.get_slots(terminal_steps.agent_id)
+                rewards[slots] += terminal_steps.reward
+                dones[slots] = True
+                truncated[slots] = terminal_steps.interrupted
+                received[slots] = True
+                self.states[slots] = self.get_observations(terminal_steps)
+
+            if len(decision_steps) > 0:
+                slots = self.get_slots(decision_steps.agent_id)
+                observations = self.get_observations(decision_steps)
+
+                # decisions after the end of an episode belong to the next one
+                running = ~dones[slots]
+                rewards[slots[running]] += decision_steps.reward[running]
+                self.states[slots[running]] = observations[running]
+                self.next_states[slots[~running]] = observations[~running]
+                self.restarted[slots[~running]] = True
+                received[slots] = True
+
+            self.decision_ids = decision_steps.agent_id
+
+        return self.states[indices], rewards[indices], dones[indices], truncated[indices]
+
+    def close(self):
+        self.env.close()
+
+
+def create_shared_array(shape, dtype):
+    size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    block = shared_memory.SharedMemory(create=True, size=size)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def attach_shared_arrays(layout):
+    blocks, arrays = [], []
+    for name, shape, dtype in layout:
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=block.buf))
+    return blocks, arrays
+
+def subproc_worker(conn, env_fn, env_id):
+    # the trainer handles KeyboardInterrupt and closes the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    env = None
+    blocks = []
+    try:
+        env = env_fn()
+        conn.send((env.observation_space, env.action_space, getattr(env, "_max_episode_steps", None)))
+
+        while True:
+            command, data = conn.recv()
+
+            if command == "attach":
+                blocks, (states, actions, rewards, dones, truncated) = attach_shared_arrays(data)
+            elif command == "reset":
+                states[env_id] = env.reset()
+            elif command == "step":
+                state, reward, done, info = env.step(actions[env_id])
+                states[env_id]    = state
+                rewards[env_id]   = reward
+                dones[env_id]     = done
+                truncated[env_id] = info.get("TimeLimit.truncated", False)
+            elif command == "close":
+                break
+            conn.send(None)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        conn.send(traceback.format_exc())
+    finally:
+        for block in blocks:
+            block.close()
+        if env is not None:
+            env.close()
+        conn.close()
+
+
+class SubprocVectorEnv:
+    def __init__(self, env_fns):
+        self.env_fns = env_fns
+        self.num_envs = len(env_fns)
+        self.closed = False
+
+        self.processes = [None] * self.num_envs
+        self.conns     = [None] * self.num_envs
+
+        # workers have to share the resource tracker of the trainer,
+        # otherwise they unlink the shared memory when they exit
+        if os.name == "posix":
+            resource_tracker.ensure_running()
+
+        for i in range(self.num_envs):
+            self.observation_space, self.action_space, max_episode_steps = self.start(i)
+        if max_episode_steps is not None:
+            self._max_episode_steps = max_episode_steps
+
+        # observations, actions, rewards, dones and time limits of all workers live in shared memory
+        state_dim = self.observation_space.shape[0]
+        act_dim   = self.action_space.shape[0]
+        self.blocks, arrays = zip(*[
+            create_shared_array((self.num_envs, state_dim), np.float32),
+            create_shared_array((self.num_envs, act_dim),   np.float32),
+            create_shared_array((self.num_envs,),           np.float64),
+            create_shared_array((self.num_envs,),           bool),
+            create_shared_array((self.num_envs,),           bool)])
+        self.states, self.actions, self.rewards, self.dones, self.truncated = arrays
+        self.layout = [(block.name, array.shape, array.dtype) for block, array in zip(self.blocks, arrays)]
+
+        for i in range(self.num_envs):
+            self.attach(i)
+
+        # shut the workers down even if training stops with an exception
+        atexit.register(self.close)
+
+    def start(self, i):
+        parent_conn, child_conn = mp.Pipe()
+        process = mp.Process(target=subproc_worker, args=(child_conn, self.env_fns[i], i), daemon=True)
+        process.start()
+        child_conn.close()
+
+        self.processes[i] = process
+        self.conns[i] = parent_conn
+        return self.receive(i)
+
+    def attach(self, i):
+        self.conns[i].send(("attach", self.layout))
+        self.receive(i)
+
+    def restart(self, i):
+        print("Environment worker {} crashed, restarting it".format(i))
+        self.processes[i].join(timeout=1)
+        if self.processes[i].is_alive():
+            self.processes[i].terminate()
+        self.start(i)
+        self.attach(i)
+
+    def receive(self, i):
+        try:
+            message = self.conns[i].recv()
+        except (EOFError, ConnectionResetError):
+            raise ChildProcessError("Environment worker {} died".format(i))
+        if isinstance(message, str):
+            raise ChildProcessError("Environment worker {} failed:\n{}".format(i, message))
+        return message
+
+    def get_indices(self, indices):
+        return np.arange(self.num_envs) if indices is None else indices
+
+    def execute(self, command, indices):
+        # send the command to all workers first so they run in parallel
+        failed = []
+        for i in indices:
+            try:
+                self.conns[i].send((command, None))
+            except (BrokenPipeError, ConnectionResetError):
+                failed.append(i)
+
+        for i in indices:
+            if i in failed:
+                continue
+            try:
+                self.receive(i)
+            except ChildProcessError:
+                failed.append(i)
+
+        # replace crashed workers and start a fresh episode in them
+        for i in failed:
+            self.restart(i)
+            self.conns[i].send(("reset", None))
+            self.receive(i)
+        return failed
+
+    def reset(self, indices=None):
+        indices = self.get_indices(indices)
+        self.execute("reset", indices)
+        return self.states[indices]
+
+    def step(self, actions, indices=None):
+        indices = self.get_indices(indices)
+        self.actions[indices] = actions
+
+        # a crashed worker ends its episode without reward
+        failed = self.execute("step", indices)
+        self.rewards[failed] = 0
+        self.dones[failed] = True
+        self.truncated[failed] = False
+
+        return self.states[indices], self.rewards[indices], self.dones[indices], self.truncated[indices]
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        for conn in self.conns:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.conns:
+            conn.close()
+
+        # release the shared memory
+        self.states = self.actions = self.rewards = self.dones = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
@@ -0,0 +1,132 @@
+import multiprocessing as mp
+import argparse
+import tempfile
+import glob
+import json
+import csv
+import os
+
+import numpy as np
+
+import environment
+from commandline import str2bool
+from policy import NumpyPolicy, export_checkpoint
+
+# environment of the worker process
+env = None
+
+
+def find_checkpoints(path):
+    # every checkpoint below a run folder or a target/<env>/<algo> tree, given without the suffix
+    paths = glob.glob(os.path.join(path, "**", "*_actor.nn"), recursive=True)
+    return sorted(p[:-len("_actor.nn")] for p in paths)
+
+
+def get_activation(checkpoint_path, default):
+    # activation of the run which stored the checkpoint
+    settings_path = os.path.join(os.path.dirname(checkpoint_path), "settings.json")
+    if os.path.isfile(settings_path):
+        with open(settings_path) as f:
+            settings = json.load(f)
+        if isinstance(settings, dict) and "activation" in settings:
+            return settings["activation"]
+    return default
+
+
+def init_worker(env_name, worker_ids, time_scale):
+    # every worker steps its own environment, unity instances need different worker ids
+    global env
+    env = environment.make_env(env_name, no_graphics=True, worker_id=worker_ids.get(), time_scale=time_scale)
+    mp.util.Finalize(env, env.close, exitpriority=10)
+
+
+def evaluate_policy(task):
+    name, policy_path, episodes, max_step, deterministic, seed = task
+    policy = NumpyPolicy(policy_path, seed)
+
+    returns = []
+    for _ in range(episodes):
+        state = env.reset()
+        total_return = 0
+        for _ in range(max_step):
+            state, reward, done, _ = env.step(policy.act(state, deterministic))
+            total_return += float(reward)
+            if done:
+                break
+        returns.append(total_return)
+    return name, returns
+
+
+def write_summary(path, results):
+    # checkpoints ranked by their mean return
+    rows = sorted(([name, np.mean(returns), np.std(returns), np.min(returns), np.max(returns)]
+                   for name, returns in results), key=lambda row: -row[1])
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "checkpoint", "mean", "std", "min", "max"])
+        for rank, row in enumerate(rows, 1):
+            writer.writerow([rank] + row)
+
+    print("{: >4} {: <40} {: >12} {: >10} {: >12} {: >12}".format("rank", "checkpoint", "mean", "std", "min", "max"))
+    for rank, (name, mean, std, low, high) in enumerate(rows, 1):
+        print("{: >4d} {: <40} {: >12.2f} {: >10.2f} {: >12.2f} {: >12.2f}".format(rank, name, mean, std, low, high))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Evaluate all checkpoints of a run or of all runs in a folder')
+    parser.add_argument("path",                                         type=str,       help="Run folder or folder of runs e.g. target/static_worm/appo")
+    parser.add_argument("-n", "--env_name",     default=None,           type=str,       help="Define the environment, taken from target/<env>/<algo> by default")
+    parser.add_argument("-k", "--episodes",     default=10,             type=int,       help="Episodes of every checkpoint")
+    parser.add_argument("-w", "--workers",      default=mp.cpu_count(), type=int,       help="Number of worker processes")
+    parser.add_argument("--deterministic",      default=False,          type=str2bool,  help="Act with the mean action")
+    parser.add_argument("--max_step",           default=1000,           type=int,       help="max_timesteps_per_episode")
+    parser.add_argument("--activation",         default="Tanh",         type=str,       help="Activation function of runs without settings")
+    parser.add_argument("--time_scale",         default=20.,            type=float,     help="Time scale of unity")
+    parser.add_argument("--worker_id",          default=0,              type=int,       help="Worker id (port offset) of the first unity environment")
+    parser.add_argument("--seed",               default=0,              type=int,       help="Seed of the sampled actions")
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path)
+    env_name = args.env_name
+    if env_name is None:
+        # <target>/<env>/<algo>[/run_xxx]
+        parts = os.path.relpath(path, os.path.join(os.path.dirname(os.path.abspath(__file__)), "target")).split(os.sep)
+        env_name = parts[0]
+
+    checkpoints = find_checkpoints(path)
+    if len(checkpoints) == 0:
+        raise Exception("No checkpoints found in {}".format(path))
+
+    # the episodes of a checkpoint are split if there are more workers than checkpoints
+    splits = max(1, min(args.episodes, int(np.ceil(args.workers / len(checkpoints)))))
+    workers = max(1, min(args.workers, len(checkpoints) * splits))
+
+    with tempfile.TemporaryDirectory() as folder:
+        # the workers act with the numpy policies, torch is only used for the export
+        tasks = []
+        for i, checkpoint in enumerate(checkpoints):
+            policy_path = os.path.join(folder, "%d.npz" % i)
+            export_checkpoint(checkpoint, policy_path, get_activation(checkpoint, args.activation))
+            name = os.path.relpath(checkpoint, path)
+            for j, episodes in enumerate(np.array_split(np.arange(args.episodes), splits)):
+                tasks.append((name, policy_path, len(episodes), args.max_step, args.deterministic,
+                              args.seed + i * splits + j))
+
+        worker_ids = mp.Manager().Queue()
+        for i in range(workers):
+            worker_ids.put(args.worker_id + i)
+
+        pool = mp.Pool(workers, initializer=init_worker, initargs=(env_name, worker_ids, args.time_scale))
+        try:
+            returns = {}
+            for name, episode_returns in pool.imap(evaluate_policy, tasks):
+                returns.setdefault(name, []).extend(episode_returns)
+
+            # workers close their environments when they exit
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+
+    write_summary(os.path.join(path, "evaluation.csv"), list(returns.items()))
@@ -1,22 +1,45 @@
-import os, sys, re
+import os, sys, re, time
+import functools
+import random
+import tempfile
 from glob import glob as listdir
 
 sys.coinit_flags = 2
 
-import matplotlib.pyplot as plt
-from ray import tune
 import numpy as np
-from torch import nn
 import json
 import torch
 
 import environment
+import plotting
+import timing
 import commandline
+import distributed
 from ppo import PPO
 from a2c import A2C
+from sampler import AsyncSampler
+from ray_sampler import RaySampler
+from checkpoint import CheckpointWriter, write_resume, load_resume, set_rng_state
+from metrics import MetricsLog, METRICS_FILE, load_metrics, truncate_metrics
+from policy import NumpyPolicy, export_model
+from src.mlflow_logging import MlflowSink
 
+# single file checkpoint of a run which is continued with --resume
+RESUME_FILE = "resume.pt"
+
+# batch of the last checkpoint of a tune trial, checkpoints are attached to the next report after tune_checkpoints batches
+tune_checkpoint = 0
+
+# arguments of the command line which are not replaced by the settings of a resumed run
+RESUME_ARGUMENTS = ["resume", "episodes", "mode", "graphics", "load", "tuning", "profile", "profile_start",
+                    "profile_batches", "learners"]
+
+
+def episode(env, agent, nr_episode, policy=None):
+    # the numpy runtime replaces the policy of the agent
+    if policy is None:
+        policy = agent.policy
 
-def episode(env, agent, nr_episode):
     state = env.reset()
     discounted_return = 0
     total_return = 0
@@ -25,14 +48,14 @@ def episode(env, agent, nr_episode):
     while not done:
         env.render()
         # 1. Select action according to policy
-        action = agent.policy(state)
+        action = policy(state)
         print(action)
         # 2. Execute selected action
         next_state, reward, done, _ = env.step(action)
         # 3. Integrate new experience into agent
         agent.update(state, action, reward, next_state, done)
         state = next_state
-        reward = (reward if type(reward) == int else reward.item())
+        reward = float(reward)
         discounted_return += (args.gamma ** t) * reward
         total_return += reward
         t += 1
@@ -40,50 +63,129 @@ def episode(env, agent, nr_episode):
     return total_return
 
 
-def loop(folder, agent, episodes, logger):
-    episode = 0
-    batch = 0
+def loop(folder, agent, episodes, logger, episode=0, batch=0, best=None):
+    # collect the batch with ray actors or the next batch in the background while the learner trains
+    sampler = None
+    if args.ray_workers > 0:
+        sampler = RaySampler(agent, args.ray_workers, args.ray_address)
+    elif args.async_rollout:
+        sampler = AsyncSampler(agent)
+
+    # checkpoints are written in the background
+    writer = CheckpointWriter()
+
+    # metrics are sent to mlflow in the background
+    sink = None
+    if args.mlflow_uri is not None:
+        sink = MlflowSink(args.mlflow_uri, args.mlflow_experiment, os.path.basename(folder), args.mlflow_interval)
+        sink.log_params(commandline.get_settings(args))
+
+    # append only metrics file, a loaded history becomes the first row
+    metrics = MetricsLog(os.path.join(folder, METRICS_FILE))
+    if batch == 0 and any(len(values) > 0 for values in logger.values()):
+        metrics.append(batch, logger)
 
-    best = None
+    # profile a window of batches
+    timers = args.timers
+    profiler = timing.Profiler(args.profile, folder, timers) if args.profile != "none" else None
+    profile_stop = batch + args.profile_start + args.profile_batches
 
     while episode < episodes:
         try:
+            if profiler is not None and batch == profile_stop - args.profile_batches:
+                profiler.start()
+            start = time.perf_counter()
+
             # Perform rollout to get batches
-            states, next_states, actions, log_probs, rewards, dones, sum_rewards, discounted_return = agent.rollout()
+            with timers.phase("Rollout"):
+                if sampler is not None:
+                    data, policy_lag = sampler.get()
+                else:
+                    data, policy_lag = agent.rollout(), 0
+            states, next_states, actions, log_probs, values, next_values, rewards, dones, sum_rewards, discounted_return = data
 
             # Perform updated and learn from rollout
-            actor_loss, critic_loss, entropy = agent.learn(states, next_states, actions, log_probs, rewards, dones,
-                                                           discounted_return)
+            with timers.phase("Learn"):
+                actor_loss, critic_loss, entropy = agent.learn(states, next_states, actions, log_probs, values,
+                                                               next_values, rewards, dones, discounted_return)
+
+            if sampler is not None:
+                sampler.release()
 
-            avg_rewards = np.mean(sum_rewards)
-            std_rewads = np.std(sum_rewards)
+            # with --fixed_horizon a batch may end without a finished episode
+            avg_rewards = np.mean(sum_rewards) if len(sum_rewards) > 0 else float("nan")
+            std_rewads = np.std(sum_rewards) if len(sum_rewards) > 0 else float("nan")
 
             # Add the number of rewards from rollout
             episode += len(sum_rewards)
             batch += 1
 
-            if not args.tuning or batch % 10 == 0:
-                pattern = "\tBatch {: >4d} Episode {: >8d} \tRewards {: >12.2f} \tStd {: >6.6f} \tActor Loss {: >12.6f} \tCritic Loss {: >12.2f} \tEntropy {: >12.2f}"
-                print(pattern.format(batch, episode, avg_rewards, std_rewads, actor_loss, critic_loss, entropy))
-
-            logger["Total Reward"].extend(sum_rewards)
-            logger["Average Reward"].append(avg_rewards)
-            logger["Std"].append(std_rewads)
-            logger["Actor Loss"].append(actor_loss)
-            logger["Critic Loss"].append(critic_loss)
-            logger["Avg Std"].append(np.std(logger["Average Reward"][-min(len(logger["Average Reward"]), 15):]))
-            logger["Entropy"].append(entropy)
+            # environment steps per second of the whole batch
+            steps_per_second = len(states) / (time.perf_counter() - start)
 
-            if best is None or avg_rewards > best:
-                agent.model.save(os.path.join(folder, "best"), logger)
-                best = avg_rewards
+            if not args.tuning or batch % 10 == 0:
+                pattern = "\tBatch {: >4d} Episode {: >8d} \tRewards {: >12.2f} \tStd {: >6.6f} \tActor Loss {: >12.6f} \tCritic Loss {: >12.2f} \tEntropy {: >12.2f} \tSteps/s {: >8.0f}"
+                print(pattern.format(batch, episode, avg_rewards, std_rewads, actor_loss, critic_loss, entropy, steps_per_second))
+                if args.ray_workers > 0:
+                    print("\tWorker Steps/s " + " ".join("{: >8.0f}".format(rate) for rate in sampler.steps_per_second))
+
+            row = {
+                "Total Reward":   [float(reward) for reward in sum_rewards],
+                "Average Reward": float(avg_rewards),
+                "Std":            float(std_rewads),
+                "Actor Loss":     actor_loss,
+                "Critic Loss":    critic_loss,
+                "Avg Std":        get_avg_std(logger["Average Reward"][-14:] + [avg_rewards]),
+                "Entropy":        entropy,
+            }
+            if sampler is not None:
+                row["Policy Lag"] = policy_lag
+
+            # checkpoints and plots of a batch are timed with the next batch
+            for phase, seconds in timers.pop().items():
+                row["Time " + phase] = seconds
+            row["Steps/s"] = steps_per_second
+            if args.ray_workers > 0:
+                for i, rate in enumerate(sampler.steps_per_second):
+                    row["Steps/s Worker %d" % i] = rate
+            row["RSS"] = timing.get_rss()
+
+            # only the new row is written to the metrics file
+            metrics.append(batch, row)
+            if sink is not None:
+                sink.log_metrics({name: value for name, value in row.items() if not isinstance(value, list)}, batch)
+            for name, value in row.items():
+                if isinstance(value, list):
+                    logger[name].extend(value)
+                else:
+                    logger[name].append(value)
+
+            with timers.phase("Checkpoint"):
+                # report to tune, schedulers stop hopeless trials early
+                if args.tuning:
+                    report(folder, agent, episode, batch, row)
+
+                if len(sum_rewards) > 0 and (best is None or avg_rewards > best):
+                    writer.save(agent.model, os.path.join(folder, "best"), batch)
+                    best = avg_rewards
+
+                if batch > 0 and batch % args.checkpoints == 0:
+                    checkpoint = int(batch / args.checkpoints)
+                    writer.save(agent.model, os.path.join(folder, "checkpoint_%02d" % checkpoint), batch)
+
+                # everything needed to continue after this batch with --resume
+                progress = {"episode": episode, "batch": batch, "steps": args.episode,
+                            "best": None if best is None else float(best),
+                            "settings": commandline.get_settings(args)}
+                writer.save_resume(agent.model, os.path.join(folder, RESUME_FILE), progress)
 
             if batch > 0 and batch % args.checkpoints == 0:
-                checkpoint = int(batch / args.checkpoints)
-                agent.model.save(os.path.join(folder, "checkpoint_%02d" % checkpoint), logger)
-
                 # add temporary plot
-                plot(folder, logger)
+                with timers.phase("Plot"):
+                    plot(folder, logger)
+
+            if profiler is not None and batch == profile_stop:
+                profiler.stop()
 
             if args.interrupt and batch > 10 and all(std < 20 for std in logger["Avg Std"][-10:]):
                 break
@@ -91,96 +193,148 @@ def loop(folder, agent, episodes, logger):
         except KeyboardInterrupt:
             break
         except Exception as e:
+            # stop the background threads, written checkpoints stay valid
+            if profiler is not None:
+                profiler.stop()
+            if sampler is not None:
+                sampler.close()
+            if sink is not None:
+                sink.close()
+            writer.close()
+            metrics.close()
             raise e
 
-    agent.model.save(os.path.join(folder, "final"), logger)
+    if profiler is not None:
+        profiler.stop()
+    if sampler is not None:
+        sampler.close()
+
+    if sink is not None:
+        sink.close()
+
+    # wait until all checkpoints are on disk
+    writer.save(agent.model, os.path.join(folder, "final"), batch)
+    writer.close()
+    metrics.close()
+
+
+def get_avg_std(rewards):
+    # batches without a finished episode have no average reward
+    rewards = [reward for reward in rewards if not np.isnan(reward)]
+    return float(np.std(rewards)) if len(rewards) > 0 else float("nan")
+
+
+def report(folder, agent, episode, batch, row):
+    from ray import tune
+    global tune_checkpoint
 
+    # batches without a finished episode (--fixed_horizon) have no average reward to compare the trials on,
+    # the schedulers count episodes, so nothing is reported until the next episode ends
+    if np.isnan(row["Average Reward"]):
+        return
 
-def plot(folder, logger, columns=2, use_average=False, start_avg=1, smoothing=0.9):
-    # calculate number of culumns
-    rows = int((columns - 1 - 2 + len(logger)) / columns)
+    metrics = {"episode": episode, "average_reward": row["Average Reward"], "std": row["Std"],
+               "actor_loss": row["Actor Loss"], "critic_loss": row["Critic Loss"], "entropy": row["Entropy"]}
+    if batch - tune_checkpoint < args.tune_checkpoints:
+        tune.report(metrics)
+        return
 
-    # create subplots
-    fig, axs = plt.subplots(rows, columns, figsize=(14, 10), constrained_layout=True)
+    # paused or promoted trials resume from the last checkpoint instead of restarting,
+    # tune copies the folder into the storage of the trial before report returns
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        agent.model.save(os.path.join(checkpoint_dir, "tune"), batch)
+        write_resume(os.path.join(checkpoint_dir, RESUME_FILE), agent.model.get_resume_state())
+        with open(os.path.join(checkpoint_dir, "progress.json"), "w") as file:
+            json.dump({"folder": folder, "episode": episode, "batch": batch, "steps": args.episode}, file)
+        tune.report(metrics, checkpoint=tune.Checkpoint.from_directory(checkpoint_dir))
+    tune_checkpoint = batch
 
-    plot_id = 0
+
+def plot(folder, logger, columns=2, use_average=False, start_avg=1, smoothing=0.9, max_points=2000, wait=False):
+    series = []
 
     # create plot for every entry in the logger
     for name, values in logger.items():
-        if name in ["Std", "Avg Std"]: continue
-
-        # calculate the position of the subplot
-        xi = plot_id % columns
-        yi = int(plot_id / columns)
-
-        # define x range 
-        x = list(range(len(values) - start_avg + 1))
-
-        # calculate y values with smoothing
-        y = [sum(values[:start_avg]) / start_avg]
-        for t, r in enumerate(values[start_avg:]):
-            if use_average:
-                temp = y[-1] + (1 / (t + 1)) * (r - y[-1])
-            else:
-                temp = y[-1] * smoothing + r * (1 - smoothing)
-            y.append(temp)
-
-        # plot values with name as title
-        axs[yi, xi].grid()
-        axs[yi, xi].plot(x, y)
-        if plot_id == 1:
-            std = np.array(logger["Avg Std"])
-            axs[yi, xi].fill_between(x, y - std, y + std, alpha=0.5)
-
-        axs[yi, xi].set_title(name)
-        plot_id += 1
+        if name in ["Std", "Avg Std", "RSS"] or name.startswith("Time ") or name.startswith("Steps/s Worker"): continue
+
+        # calculate y values with smoothing and reduce long series to max_points
+        y = plotting.smooth(values, use_average, start_avg, smoothing)
+        indices = plotting.downsample(len(y), max_points)
+
+        std = None
+        if len(series) == 1:
+            std = np.asarray(logger["Avg Std"], dtype=np.float64)[start_avg - 1:][indices]
+
+        series.append((name, indices, y[indices], std))
+
     # Adding headline with hyperparams to plot
-    fig.suptitle('Env: {environment}, Algorithm: {algorithm}\n Gamma: {gamma}, Critic_Lr: {crit_lr}, '
-                 'Actor_Lr: {act_lr},\n Activation_func: {activation_function}, Clip: {clip}'.format(
+    title = ('Env: {environment}, Algorithm: {algorithm}\n Gamma: {gamma}, Critic_Lr: {crit_lr}, '
+             'Actor_Lr: {act_lr},\n Activation_func: {activation_function}, Clip: {clip}'.format(
         environment=args.env_name, algorithm=args.algorithm, gamma=args.gamma, crit_lr=args.critic_lr,
-        act_lr=args.actor_lr, activation_function=args.activation, clip=args.clip), fontsize=16)
+        act_lr=args.actor_lr, activation_function=args.activation, clip=args.clip))
 
-    plt.savefig(os.path.join(folder, "image.png"))
+    path = os.path.join(folder, "image.png")
 
     if args.graphics:
-        plt.show()
-
-    plt.close(fig)
+        plotting.render(path, series, title, columns, show=True)
+    else:
+        # render in a separate process so training does not wait for matplotlib
+        plotting.render_async(path, series, title, columns, wait=wait)
 
 
 def get_hyperparameter():
+    # values of the grid search, tune is only imported if it is used
     return {
-        "algorithm":    tune.grid_search(["appo"]),  # Olli|Patrick|Dominik|Lotte (appo) Alex|Georg (aa2c)
-        "gamma":        tune.grid_search([0.99]),
-        "hidden_units": tune.grid_search([[64, 64]]),  # [64, 128] ?
-        "activation":   tune.grid_search(["Tanh"]),  # ReLU ?
+        "algorithm":    ["appo"],  # Olli|Patrick|Dominik|Lotte (appo) Alex|Georg (aa2c)
+        "gamma":        [0.99],
+        "hidden_units": [[64, 64]],  # [64, 128] ?
+        "activation":   ["Tanh"],  # ReLU ?
         # define config/hyperparams for actor critic
 
         # learning rate
-        "actor_lr":     tune.grid_search([1e-4]),  # Dominik|Georg (1e-4) Patrick|Alex (1e-4) Oli (1e-5) Lotte (1e-5)
-        "critic_lr":    tune.grid_search([1e-4]),  # Dominik|Georg (1e-4) Patrick|Alex (1e-5) Oli (1e-5) Lotte (1e-6)
-        "noise":        tune.grid_search([0]), # , 0.001
+        "actor_lr":     [1e-4],  # Dominik|Georg (1e-4) Patrick|Alex (1e-4) Oli (1e-5) Lotte (1e-5)
+        "critic_lr":    [1e-4],  # Dominik|Georg (1e-4) Patrick|Alex (1e-5) Oli (1e-5) Lotte (1e-6)
+        "noise":        [0], # , 0.001
 
-        "advantage":    tune.grid_search(["advantage"]), # temporal ?
-        "normalize":    tune.grid_search(["reward", "advantage"]), # advantage, none
-        "batch_size":   tune.grid_search([5000]),
+        "advantage":    ["advantage"], # temporal ?
+        "normalize":    ["reward", "advantage"], # advantage, none
+        "batch_size":   [5000],
 
         # PPO (für aa2c auskommentieren)
-        "clip":         tune.grid_search([0.2]),  # 0.1 ?
+        "clip":         [0.2],  # 0.1 ?
         # number of times to update the actor-critic
-        "ppo_episodes": tune.grid_search([4]),
+        "ppo_episodes": [4],
         # number of steps to collect for each trajectory
-        "mini_batch_size": tune.grid_search([0, 100, 1000]),
+        "mini_batch_size": [0, 100, 1000],
 
-        # config for mlflow logging
-        # "mlflow": {
-        #     "experiment_name": "ppo",
-        #     "tracking_uri": "http://159.65.120.229:5000"
-        # }
+        # mlflow logging is configured with --mlflow_uri and --mlflow_experiment
     }
 
 
+def get_search_space():
+    from ray import tune
+    return {name: tune.grid_search(values) for name, values in get_hyperparameter().items()}
+
+
+def get_scheduler():
+    # schedulers measure the progress of a trial in episodes
+    from ray.tune import schedulers
+
+    if args.scheduler == "asha":
+        return schedulers.ASHAScheduler(time_attr="episode", max_t=args.episodes, grace_period=args.grace_period,
+                                        reduction_factor=args.reduction_factor)
+    elif args.scheduler == "hyperband":
+        return schedulers.HyperBandScheduler(time_attr="episode", max_t=args.episodes,
+                                             reduction_factor=args.reduction_factor)
+    elif args.scheduler == "median":
+        return schedulers.MedianStoppingRule(time_attr="episode", grace_period=args.grace_period)
+    elif args.scheduler == "none":
+        return None
+    raise NotImplementedError
+
+
 def trainable(hyperparameter):
+    global tune_checkpoint
     if type(hyperparameter) == dict:
         # hyperparameter tuning
         for key, value in hyperparameter.items():
@@ -188,11 +342,29 @@ def trainable(hyperparameter):
     else:
         hyperparameter = {name: getattr(args, name) for name in hyperparameter if name != "mlflow"}
 
-    # load environment
-    if args.env_name in ["dynamic_worm", "static_worm"]:
-        env = environment.load_env(name=args.env_name, no_graphics=(args.mode == "train"))
+    # define target folder
+    main_folder = os.path.abspath(os.path.join(__file__, os.pardir, "target", args.env_name, args.algorithm))
+    os.makedirs(main_folder, exist_ok=True)
+
+    resume = None
+    if args.resume is not None:
+        # the run continues with its own settings, only the number of episodes can be changed
+        resume = load_resume(os.path.join(main_folder, args.resume, RESUME_FILE))
+        for name, value in resume["progress"]["settings"].items():
+            if name not in RESUME_ARGUMENTS:
+                setattr(args, name, value)
+
+    # load environment (training steps several copies at once)
+    if args.mode == "train":
+        env = environment.create_vector_env(args.env_name, args.num_envs, no_graphics=True, backend=args.env_backend,
+                                            worker_id=args.worker_id, time_scale=args.time_scale)
     else:
-        env = environment.create_gym_env(args.env_name)
+        env = environment.make_env(args.env_name, no_graphics=False, worker_id=args.worker_id, time_scale=args.time_scale)
+
+    if args.seed is not None and resume is None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+        torch.manual_seed(args.seed)
 
     # set device
     args.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -205,7 +377,18 @@ def trainable(hyperparameter):
     args.action_high = env.action_space.high[0]
     if hasattr(env, "_max_episode_steps"):
         args.max_step = env._max_episode_steps
+
+    # several environments stop after batch_size steps instead of finishing their last episodes
+    if args.fixed_horizon is None:
+        args.fixed_horizon = args.mode == "train" and env.num_envs > 1
+    if args.fixed_horizon:
+        # every environment (of every ray worker) makes the same number of steps
+        envs = env.num_envs * max(1, args.ray_workers)
+        if args.batch_size % envs != 0:
+            args.batch_size = int(np.ceil(args.batch_size / envs)) * envs
+            print("batch_size is rounded up to {}, a multiple of the {} environments".format(args.batch_size, envs))
     args.episode = 0
+    args.timers = timing.Timers()
 
     # create agent
     if args.algorithm in ["ppo", "appo"]:
@@ -217,36 +400,86 @@ def trainable(hyperparameter):
 
     logger = {name: [] for name in
               ["Total Reward", "Average Reward", "Std", "Avg Std", "Actor Loss", "Critic Loss", "Entropy"]}
-
-    # define target folder
-    main_folder = os.path.abspath(os.path.join(__file__, os.pardir, "target", args.env_name, args.algorithm))
-    os.makedirs(main_folder, exist_ok=True)
+    if args.async_rollout or args.ray_workers > 0:
+        logger["Policy Lag"] = []
+    for name in ["Time " + phase for phase in timing.PHASES] + ["Steps/s", "RSS"]:
+        logger[name] = []
+    for i in range(args.ray_workers):
+        logger["Steps/s Worker %d" % i] = []
 
     if args.load is not None:
         agent.model.load(os.path.join(main_folder, args.load), logger)
 
-    if args.mode == "train":
-        # create new folder for current training 
-        run_id = max([0] + list(map(int, [re.findall(r'\d+', matching_path)[0] for matching_path in os.listdir(main_folder)])))+1
-        folder = os.path.join(main_folder, "run_%03d" % run_id)
-        os.makedirs(folder, exist_ok=True)
-
-        # store settings
-        with open(os.path.join(folder, "settings.json"), "w") as file:
-            json.dump(hyperparameter, file, indent=4)
+    progress = {"episode": 0, "batch": 0}
+    checkpoint = None
+    if args.tuning:
+        from ray import tune
+        checkpoint = tune.get_checkpoint()
+
+    if checkpoint is not None:
+        # tune resumes the trial in its run folder
+        with checkpoint.as_directory() as checkpoint_dir:
+            with open(os.path.join(checkpoint_dir, "progress.json")) as file:
+                progress = json.load(file)
+            agent.model.load(os.path.join(checkpoint_dir, "tune"), logger)
+            if os.path.isfile(os.path.join(checkpoint_dir, RESUME_FILE)):
+                # adam continues with its moments
+                agent.model.load_resume_state(load_resume(os.path.join(checkpoint_dir, RESUME_FILE)))
+        tune_checkpoint = progress["batch"]
+        metrics_path = os.path.join(progress["folder"], METRICS_FILE)
+        truncate_metrics(metrics_path, progress["batch"])
+        logger.update(load_metrics(metrics_path))
+        args.episode = progress["steps"]
+
+    if resume is not None:
+        progress = dict(resume["progress"], folder=os.path.join(main_folder, args.resume))
+        agent.model.load_resume_state(resume)
+        metrics_path = os.path.join(progress["folder"], METRICS_FILE)
+        truncate_metrics(metrics_path, progress["batch"])
+        logger.update(load_metrics(metrics_path))
+        args.episode = progress["steps"]
+
+        # the random streams continue where the last batch ended
+        set_rng_state(resume["rng"], env)
 
-            # train agent
-        loop(folder, agent, args.episodes, logger)
+    if args.mode == "train":
+        if "folder" in progress:
+            folder = progress["folder"]
+        else:
+            # create new folder for current training 
+            run_id = max([0] + [int(match.group(1)) for match in map(re.compile(r'run_(\d+)$').match, os.listdir(main_folder)) if match])+1
+            folder = os.path.join(main_folder, "run_%03d" % run_id)
+            os.makedirs(folder, exist_ok=True)
+
+            # store settings
+            with open(os.path.join(folder, "settings.json"), "w") as file:
+                json.dump(hyperparameter, file, indent=4)
+
+        # train agent, the learner processes start with the loaded or resumed model
+        if args.learners > 1:
+            distributed.start(agent, args.learners)
+        try:
+            loop(folder, agent, args.episodes, logger, progress["episode"], progress["batch"], progress.get("best"))
+        finally:
+            distributed.stop()
 
         # plot results
-        plot(folder, logger)
+        plot(folder, logger, wait=True)
     else:
         if args.load is None:
             raise Exception("No model selected! use --load run_<id>/<name> to do this")
 
+        policy = None
+        if args.runtime == "numpy":
+            # act with the exported actor instead of the torch model
+            path = os.path.join(main_folder, args.load + "_policy.npz")
+            export_model(agent.model, path, args.float16)
+            runtime = NumpyPolicy(path)
+            policy = functools.partial(runtime.act, deterministic=args.deterministic)
+
         # show 3 examples of best episode
         for i in range(3):
-            episode(env, agent, i)
+            episode(env, agent, i, policy)
 
     # close environment
     env.close()
@@ -258,16 +491,24 @@ if __name__ == "__main__":
     args = commandline.collect_arguments()
 
     if args.tuning:
+        from ray import tune
+
         if torch.cuda.is_available():
             analysis = tune.run(
                 trainable,
-                config=get_hyperparameter(),
+                config=get_search_space(),
+                scheduler=get_scheduler(),
+                metric="average_reward",
+                mode="max",
                 resources_per_trial={'gpu': 1}
             )
         else:
             analysis = tune.run(
             trainable,
-            config=get_hyperparameter(),
+            config=get_search_space(),
+            scheduler=get_scheduler(),
+            metric="average_reward",
+            mode="max",
         )
 
     else:
@@ -0,0 +1,72 @@
+import pickle
+import json
+import os
+
+METRICS_FILE = "metrics.ndjson"
+
+
+class MetricsLog:
+    # Append only metrics file of a run, one json line per batch.
+    # Values are scalars (one per batch) or lists (e.g. one reward per episode).
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a")
+
+    def append(self, batch, row):
+        self.file.write(json.dumps(dict(batch=batch, **row)) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def load_metrics(path, max_batch=None):
+    # rebuild the logger from the metrics file, works while the run is still writing
+    logger = {}
+    with open(path) as f:
+        for line in f:
+            # the last line can be incomplete during training
+            if not line.endswith("\n"):
+                break
+
+            row = json.loads(line)
+            batch = row.pop("batch")
+            if max_batch is not None and batch > max_batch:
+                break
+
+            for name, value in row.items():
+                values = logger.setdefault(name, [])
+                if isinstance(value, list):
+                    values.extend(value)
+                else:
+                    values.append(value)
+    return logger
+
+
+def load_checkpoint_metrics(checkpoint_path):
+    # checkpoints only reference the rows of the metrics file they contain
+    with open(checkpoint_path + "_data.json") as f:
+        data = json.load(f)
+    path = os.path.join(os.path.dirname(checkpoint_path), data["metrics"])
+    if not os.path.isfile(path):
+        return {}
+    return load_metrics(path, data["batch"])
+
+
+def load_pickled_metrics(path):
+    # checkpoints of older runs contain the pickled logger, its losses are tensors
+    with open(path, "rb") as f:
+        old_logger = pickle.load(f)
+    return {name: [float(value.item() if hasattr(value, "item") else value) for value in values]
+            for name, values in old_logger.items()}
+
+
+def truncate_metrics(path, max_batch):
+    # drop the rows written after a checkpoint before a run continues from it
+    with open(path) as f:
+        lines = [line for line in f if line.endswith("\n")]
+    with open(path, "w") as f:
+        for line in lines:
+            if json.loads(line)["batch"] > max_batch:
+                break
+            f.write(line)
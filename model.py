@@ -1,15 +1,21 @@
 from abc import ABC
 from abc import abstractmethod
 
-from network import Net, ActorNet
+from network import Net, ActorNet, SharedNet
+from checkpoint import write_checkpoint
+import distributed
+from metrics import load_checkpoint_metrics, load_pickled_metrics
 import torch
+import copy
 import os
-import pickle
-from torch.distributions import MultivariateNormal
+from torch.distributions import MultivariateNormal, Normal, Independent
 import torch.nn.functional as F
 import numpy as np
 
 class BaseModel(ABC):
+    # models with a diagonal covariance use independent normals instead of a full covariance matrix
+    diagonal = False
+
     def __init__(self, args):
         self.args = args
         self.actor = None 
@@ -23,36 +29,60 @@ class BaseModel(ABC):
         assert self.actor_optimizer is not None
         assert self.critic_optimizer is not None
         
-    def save(self, checkpoint_path, logger):
-        self.actor.save(checkpoint_path + "_actor.nn")
-        self.critic.save(checkpoint_path + "_critic.nn")
-        with open(checkpoint_path + "_data.log", "wb") as f:
-            pickle.dump(logger, f)
+    def get_state(self):
+        # copy of the weights on the cpu, it is not changed by further training
+        return {name: {key: value.detach().cpu().clone() for key, value in net.state_dict().items()}
+                for name, net in [("actor", self.actor), ("critic", self.critic)]}
+
+    def get_resume_state(self):
+        # weights and adam moments, copied so training can continue while they are written
+        state = self.get_state()
+        state["actor_optimizer"]  = copy.deepcopy(self.actor_optimizer.state_dict())
+        state["critic_optimizer"] = copy.deepcopy(self.critic_optimizer.state_dict())
+        return state
+
+    def load_resume_state(self, state):
+        self.actor.load_state_dict(state["actor"])
+        self.critic.load_state_dict(state["critic"])
+        self.actor_optimizer.load_state_dict(state["actor_optimizer"])
+        self.critic_optimizer.load_state_dict(state["critic_optimizer"])
+
+    def save(self, checkpoint_path, batch):
+        write_checkpoint(checkpoint_path, self.get_state(), batch)
 
     def load(self, checkpoint_path, logger):
         self.actor.load(checkpoint_path + "_actor.nn")
         self.critic.load(checkpoint_path + "_critic.nn")
 
-        if os.path.isfile(checkpoint_path + "_data.log"):
-            with open(checkpoint_path + "_data.log", "rb") as f:
-                old_logger = pickle.load(f)
-            logger.update(old_logger)
+        if os.path.isfile(checkpoint_path + "_data.json"):
+            logger.update(load_checkpoint_metrics(checkpoint_path))
+        elif os.path.isfile(checkpoint_path + "_data.log"):
+            logger.update(load_pickled_metrics(checkpoint_path + "_data.log"))
     
+    def create_optimizer(self, parameters, lr):
+        # foreach and fused update all parameters of a net in a few kernels
+        if self.args.adam == "foreach":
+            return torch.optim.Adam(parameters, lr=lr, foreach=True)
+        elif self.args.adam == "fused":
+            return torch.optim.Adam(parameters, lr=lr, fused=True)
+        elif self.args.adam == "default":
+            return torch.optim.Adam(parameters, lr=lr)
+        raise NotImplementedError
+
     def optimize(self, actor_loss, critic_loss):
-        # Calculate gradients and perform backward propagation for actor network
-        self.actor_optimizer.zero_grad()
-        actor_loss.backward()
-        if self.args.max_grad_norm > 0:
-            torch.nn.utils.clip_grad_norm_(self.actor.get_parameters(), self.args.max_grad_norm)
-        self.actor_optimizer.step()
-
-        # Calculate gradients and perform backward propagation for critic network
-        self.critic_optimizer.zero_grad()
-        critic_loss.backward()
-        if self.args.max_grad_norm > 0:
-            torch.nn.utils.clip_grad_norm_(self.critic.get_parameters(), self.args.max_grad_norm)
-        self.critic_optimizer.step()
-    
+        # actor and critic share no parameters, so one backward pass of both losses
+        # gives the same gradients as separate passes
+        with self.args.timers.phase("Optimize"):
+            self.actor_optimizer.zero_grad(set_to_none=True)
+            self.critic_optimizer.zero_grad(set_to_none=True)
+            (actor_loss + critic_loss).backward()
+            distributed.all_reduce_gradients(list(self.actor.get_parameters()) + list(self.critic.get_parameters()))
+            if self.args.max_grad_norm > 0:
+                torch.nn.utils.clip_grad_norm_(self.actor.get_parameters(),  self.args.max_grad_norm)
+                torch.nn.utils.clip_grad_norm_(self.critic.get_parameters(), self.args.max_grad_norm)
+            self.actor_optimizer.step()
+            self.critic_optimizer.step()
+
     @abstractmethod
     def get_base(self, state):
         raise NotImplementedError
@@ -65,26 +95,41 @@ class BaseModel(ABC):
     def get_covmat(self, state):
         raise NotImplementedError
 
+    def get_variance(self, state):
+        raise NotImplementedError
+
     @abstractmethod
     def get_value(self, state):
         raise NotImplementedError
 
+    def get_value_of_base(self, states, base):
+        # value estimate of states whose base was already computed for the actor
+        return self.get_value(states)
+
     def distribution(self, states):
-        base   = self.get_base(states)
-        mean   = self.get_mean(base)
-        covmat = self.get_covmat(base)
+        return self.get_distribution(self.get_base(states))
+
+    def get_distribution(self, base):
+        mean = self.get_mean(base)
+
+        if self.diagonal:
+            # Independent normals have the same log prob and entropy as a diagonal
+            # Multivariate Normal Distribution but need no cholesky factorization
+            std = self.get_variance(base).sqrt()
+            return Independent(Normal(mean, std.expand_as(mean)), 1)
 
         # Creating Multivariate Normal Distribution
-        return MultivariateNormal(mean, covmat)
+        return MultivariateNormal(mean, self.get_covmat(base))
 
+    @torch.no_grad()
     def get_action(self, states):
         # convert state to tensor if it's a numpy array
         if isinstance(states, np.ndarray):
             states = torch.tensor(states, dtype=torch.float, device=self.args.device)
 
-        # Creating Multivariate Normal Distribution
-        dist = self.distribution(states)
+        return self.sample(self.distribution(states))
 
+    def sample(self, dist):
         # Sample action from distribution and get log prob
         action   = dist.sample()
         log_prob = dist.log_prob(action)
@@ -96,20 +141,39 @@ class BaseModel(ABC):
         # log prob as tensor is fine.
         return action.detach().cpu().numpy(), log_prob.detach()
 
+    @torch.no_grad()
+    def value(self, states):
+        # critic only path, the actor is not evaluated
+        if isinstance(states, np.ndarray):
+            states = torch.tensor(states, dtype=torch.float, device=self.args.device)
+        return self.get_value(states).reshape(states.shape[:-1])
+
+    @torch.no_grad()
+    def act(self, states):
+        # action, log prob and value estimate of the states during rollout
+        if isinstance(states, np.ndarray):
+            states = torch.tensor(states, dtype=torch.float, device=self.args.device)
+        base = self.get_base(states)
+        action, log_prob = self.sample(self.get_distribution(base))
+        return action, log_prob, self.get_value_of_base(states, base).reshape(states.shape[:-1])
+
     def evaluate(self, states, actions):
         # convert state to tensor if it's a numpy array
         if isinstance(states, np.ndarray):
             states = torch.tensor(states, dtype=torch.float, device=self.args.device)
 
         # Creating Multivariate Normal Distribution
-        dist      = self.distribution(states)
+        base      = self.get_base(states)
+        dist      = self.get_distribution(base)
         log_probs = dist.log_prob(actions)
         entropy   = dist.entropy().mean()
-        V         = self.get_value(states)
+        V         = self.get_value_of_base(states, base)
         return V, log_probs, entropy
 
 
 class Model(BaseModel):
+    diagonal = True
+
     def __init__(self, args):
         BaseModel.__init__(self, args)
         
@@ -118,14 +182,14 @@ class Model(BaseModel):
         self.critic = Net(args.device, args.state_dim, args.hidden_units, 1, args.activation)
 
         # Initialize optimizer
-        self.actor_optimizer  = torch.optim.Adam(self.actor.get_parameters(),  lr=args.actor_lr)
-        self.critic_optimizer = torch.optim.Adam(self.critic.get_parameters(), lr=args.critic_lr)
+        self.actor_optimizer  = self.create_optimizer(self.actor.get_parameters(),  args.actor_lr)
+        self.critic_optimizer = self.create_optimizer(self.critic.get_parameters(), args.critic_lr)
 
         # Create our variable for the matrix
         # Chose 0.5 for standarddeviation
         # Create covariance matrix
         self.cov_var = torch.full(size=(args.act_dim,), fill_value=0.5, device=self.args.device)
-        self.cov_mat = torch.diag(self.cov_var, device=self.args.device)
+        self.cov_mat = torch.diag(self.cov_var)
         
         self.check()
 
@@ -140,10 +204,15 @@ class Model(BaseModel):
     def get_covmat(self, states):
         return self.cov_mat
 
+    def get_variance(self, states):
+        return self.cov_var
+
     def get_value(self, states):
         return self.critic.net(states).squeeze()
 
 class AdvancedModel(BaseModel):
+    diagonal = True
+
     def __init__(self, args):
         BaseModel.__init__(self, args)
 
@@ -152,8 +221,8 @@ class AdvancedModel(BaseModel):
         self.critic = Net(args.device, args.state_dim, args.hidden_units, 1, args.activation).to(device=args.device)
 
         # Initialize optimizer
-        self.actor_optimizer  = torch.optim.Adam(self.actor.get_parameters(),  lr=args.actor_lr)
-        self.critic_optimizer = torch.optim.Adam(self.critic.get_parameters(), lr=args.critic_lr)
+        self.actor_optimizer  = self.create_optimizer(self.actor.get_parameters(),  args.actor_lr)
+        self.critic_optimizer = self.create_optimizer(self.critic.get_parameters(), args.critic_lr)
         
         self.check()
 
@@ -164,9 +233,45 @@ class AdvancedModel(BaseModel):
         return torch.tanh(self.actor.mean(base))
 
     def get_covmat(self, base):
-        var = F.softplus(self.actor.std(base))
+        var = self.get_variance(base)
         cov_mat = torch.diag_embed(var)
         return cov_mat
 
+    def get_variance(self, base):
+        return F.softplus(self.actor.std(base))
+
+    def get_value(self, states):
+        return self.critic.net(states).squeeze()
+
+class SharedModel(AdvancedModel):
+    # The actor and the critic are one SharedNet, the body runs once for the
+    # policy and the value and both losses train it with a single optimizer
+    def __init__(self, args):
+        BaseModel.__init__(self, args)
+
+        self.actor  = SharedNet(args.device, args.state_dim, args.hidden_units, args.act_dim, args.activation)
+        self.critic = self.actor
+
+        # the body is trained with the learning rate of the actor
+        self.actor_optimizer = self.create_optimizer([
+            {"params": self.actor.get_policy_parameters(), "lr": args.actor_lr},
+            {"params": self.actor.get_value_parameters(),  "lr": args.critic_lr}], args.actor_lr)
+        self.critic_optimizer = self.actor_optimizer
+
+        self.check()
+
     def get_value(self, states):
-        return self.critic.net(states).squeeze()
\ No newline at end of file
+        return self.get_value_of_base(states, self.get_base(states))
+
+    def get_value_of_base(self, states, base):
+        return self.actor.value(base).squeeze()
+
+    def optimize(self, actor_loss, critic_loss):
+        # one backward pass through the body with the weighted sum of both losses
+        with self.args.timers.phase("Optimize"):
+            self.actor_optimizer.zero_grad(set_to_none=True)
+            (actor_loss + self.args.value_coef * critic_loss).backward()
+            distributed.all_reduce_gradients(self.actor.get_parameters())
+            if self.args.max_grad_norm > 0:
+                torch.nn.utils.clip_grad_norm_(self.actor.get_parameters(), self.args.max_grad_norm)
+            self.actor_optimizer.step()
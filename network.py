@@ -65,4 +65,20 @@ class ActorNet(BaseNet):
         self.std.bias.data.fill_(1e-5)
 
     def get_parameters(self):
-        return list(self.net.parameters()) + list(self.mean.parameters()) + list(self.std.parameters())
\ No newline at end of file
+        return list(self.net.parameters()) + list(self.mean.parameters()) + list(self.std.parameters())
+
+class SharedNet(ActorNet):
+    # ActorNet with a value head on the same body, it is the actor and the critic of the SharedModel
+    def __init__(self, device, in_dim, hidden_units, out_dim, activation):
+        ActorNet.__init__(self, device, in_dim, hidden_units, out_dim, activation)
+
+        self.value = nn.Linear(self.mean.in_features, 1).to(device)
+
+    def get_policy_parameters(self):
+        return ActorNet.get_parameters(self)
+
+    def get_value_parameters(self):
+        return list(self.value.parameters())
+
+    def get_parameters(self):
+        return self.get_policy_parameters() + self.get_value_parameters()
\ No newline at end of file
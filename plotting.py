@@ -0,0 +1,107 @@
+import multiprocessing as mp
+
+import numpy as np
+
+from returns import reverse_scan
+
+# process which renders the last requested plot
+process = None
+
+
+def smooth(values, use_average=False, start_avg=1, smoothing=0.9):
+    # NaN values (batches without a finished episode) are skipped, they keep the last smoothed value
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < start_avg:
+        return np.zeros(0)
+
+    head  = values[:start_avg][~np.isnan(values[:start_avg])]
+    first = head.mean() if len(head) > 0 else np.nan
+    rest  = values[start_avg:]
+
+    if use_average:
+        # running average of the values after the start
+        valid = ~np.isnan(rest)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average = np.cumsum(np.where(valid, rest, 0)) / np.cumsum(valid)
+        return np.concatenate([[first], average])
+
+    # exponential smoothing y[t] = smoothing * y[t - 1] + (1 - smoothing) * r[t],
+    # computed as reverse scan over the reversed series
+    series = np.concatenate([[first], rest])
+    missing = np.isnan(series)
+    if missing.all():
+        return series
+
+    x    = (1 - smoothing) * series
+    coef = np.full(len(x), smoothing)
+
+    # the smoothing starts with the first value, NaN values keep y[t - 1]
+    start = np.argmax(~missing)
+    x[start], coef[start] = series[start], 0
+    x[missing], coef[missing] = 0, 1
+
+    y = reverse_scan(x[::-1], coef[::-1])[::-1]
+    y[:start] = np.nan
+    return y
+
+
+def downsample(length, max_points):
+    # indices of at most max_points evenly spaced values, always including the last one
+    stride = max(1, int(np.ceil(length / max_points)))
+    indices = np.arange(0, length, stride)
+    if length > 0 and indices[-1] != length - 1:
+        indices = np.append(indices, length - 1)
+    return indices
+
+
+def render(path, series, title, columns=2, show=False):
+    # series is a list of (name, x, y, std) with std being None or an array like y
+    import matplotlib
+    if not show:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    rows = max(1, int(np.ceil(len(series) / columns)))
+
+    # create subplots
+    fig, axs = plt.subplots(rows, columns, figsize=(14, 10), constrained_layout=True, squeeze=False)
+
+    for plot_id, (name, x, y, std) in enumerate(series):
+        # calculate the position of the subplot
+        xi = plot_id % columns
+        yi = int(plot_id / columns)
+
+        # plot values with name as title
+        axs[yi, xi].grid()
+        axs[yi, xi].plot(x, y)
+        if std is not None:
+            axs[yi, xi].fill_between(x, y - std, y + std, alpha=0.5)
+
+        axs[yi, xi].set_title(name)
+
+    fig.suptitle(title, fontsize=16)
+
+    plt.savefig(path)
+
+    if show:
+        plt.show()
+
+    plt.close(fig)
+
+
+def render_async(path, series, title, columns=2, wait=False):
+    # renders in a separate process, a plot requested while the last one is still
+    # rendering is skipped unless the caller waits for it. The process is spawned, a fork
+    # would copy the threads of torch and the environments of the trainer
+    global process
+    if process is not None and process.is_alive():
+        if not wait:
+            return
+        process.join()
+
+    context = mp.get_context("spawn")
+    process = context.Process(target=render, args=(path, series, title, columns), daemon=True)
+    process.start()
+
+    if wait:
+        process.join()
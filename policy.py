@@ -0,0 +1,119 @@
+import argparse
+import re
+
+import numpy as np
+
+# activations of the nets, named like the torch.nn modules in --activation
+ACTIVATIONS = {
+    "Tanh":      np.tanh,
+    "ReLU":      lambda x: np.maximum(x, 0),
+    "Sigmoid":   lambda x: 1 / (1 + np.exp(-x)),
+    "ELU":       lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    "LeakyReLU": lambda x: np.where(x > 0, x, 0.01 * x),
+}
+
+
+def get_layers(state_dict, prefix):
+    # weights and biases of the linear layers of a nn.Sequential in the order of the layers
+    indices = sorted({int(match.group(1)) for match in
+                      (re.match(re.escape(prefix) + r"(\d+)\.weight$", name) for name in state_dict) if match})
+    return [(state_dict["{}{}.weight".format(prefix, i)], state_dict["{}{}.bias".format(prefix, i)]) for i in indices]
+
+
+def export_state(actor_state, path, activation="Tanh", variance=0.5, float16=False):
+    # Stores the actor as npz. Nets of the Model output the mean and have a fixed variance,
+    # ActorNets of the AdvancedModel have a mean (tanh) and std (softplus) head.
+    state = {name: value.detach().cpu().numpy() for name, value in actor_state.items()}
+    dtype = np.float16 if float16 else np.float32
+
+    arrays = {"activation": np.array(activation)}
+    layers = get_layers(state, "net.")
+    for i, (weight, bias) in enumerate(layers):
+        arrays["weight_%d" % i] = weight.astype(dtype)
+        arrays["bias_%d" % i] = bias.astype(dtype)
+
+    if "mean.weight" in state:
+        arrays["kind"] = np.array("actor")
+        for head in ["mean", "std"]:
+            arrays[head + "_weight"] = state[head + ".weight"].astype(dtype)
+            arrays[head + "_bias"] = state[head + ".bias"].astype(dtype)
+    else:
+        arrays["kind"] = np.array("net")
+        arrays["variance"] = np.full(layers[-1][1].shape, variance, dtype=dtype)
+
+    np.savez(path, **arrays)
+
+
+def export_model(model, path, float16=False):
+    variance = model.cov_var.cpu().numpy() if hasattr(model, "cov_var") else 0.5
+    export_state(model.actor.state_dict(), path, model.args.activation, variance, float16)
+
+
+def export_checkpoint(checkpoint_path, path, activation="Tanh", float16=False):
+    # torch is only needed for the export
+    import torch
+    actor_state = torch.load(checkpoint_path + "_actor.nn", map_location="cpu")
+    export_state(actor_state, path, activation, float16=float16)
+
+
+class NumpyPolicy:
+    # Actor of an exported policy without torch, weights stored as float16 are computed in float32
+    def __init__(self, path, seed=None):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+
+        self.kind = str(arrays["kind"])
+        self.activation = ACTIVATIONS[str(arrays["activation"])]
+
+        layers = len([name for name in arrays if name.startswith("weight_")])
+        self.layers = [(arrays["weight_%d" % i].astype(np.float32).T.copy(), arrays["bias_%d" % i].astype(np.float32))
+                       for i in range(layers)]
+
+        if self.kind == "actor":
+            self.mean = arrays["mean_weight"].astype(np.float32).T.copy(), arrays["mean_bias"].astype(np.float32)
+            self.std  = arrays["std_weight"].astype(np.float32).T.copy(),  arrays["std_bias"].astype(np.float32)
+        else:
+            self.variance = arrays["variance"].astype(np.float32)
+
+        self.rng = np.random.RandomState(seed)
+
+    def get_base(self, states):
+        x = np.asarray(states, dtype=np.float32)
+        for i, (weight, bias) in enumerate(self.layers):
+            if self.kind == "net" and i == len(self.layers) - 1:
+                return x
+            x = self.activation(x @ weight + bias)
+        return x
+
+    def get_mean(self, base):
+        if self.kind == "actor":
+            weight, bias = self.mean
+            return np.tanh(base @ weight + bias)
+        weight, bias = self.layers[-1]
+        return base @ weight + bias
+
+    def get_variance(self, base):
+        if self.kind == "actor":
+            weight, bias = self.std
+            return np.logaddexp(0, base @ weight + bias)
+        return self.variance
+
+    def act(self, states, deterministic=False):
+        # mean action or a sample of the diagonal normal distribution
+        base = self.get_base(states)
+        mean = self.get_mean(base)
+        if deterministic:
+            return mean
+        std = np.sqrt(self.get_variance(base))
+        return mean + std * self.rng.standard_normal(mean.shape).astype(np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the actor of a checkpoint as numpy policy')
+    parser.add_argument("checkpoint",                                   type=str,       help="Checkpoint without suffix e.g. target/static_worm/appo/run_074/best")
+    parser.add_argument("output",                                       type=str,       help="Path of the npz policy")
+    parser.add_argument("--activation",         default="Tanh",         type=str,       help="Activation function of the net (ReLU | Tanh | ...)")
+    parser.add_argument("--float16",            default=False,          action="store_true", help="Store the weights as float16")
+    args = parser.parse_args()
+
+    export_checkpoint(args.checkpoint, args.output, args.activation, args.float16)
@@ -1,7 +1,7 @@
 import torch
-import numpy as np
 
 from actorcritic import ActorCritic
+import distributed
 
 
 class PPO(ActorCritic):
@@ -14,7 +14,7 @@ class PPO(ActorCritic):
             args.mini_batch_size = args.batch_size
 
         self.minibatches = int(self.args.batch_size / self.args.mini_batch_size)
-        self.batch_indices = np.arange(self.args.batch_size)
+        self.batch_indices = torch.arange(self.args.batch_size, device=self.args.device)
 
 
     def get_actor_loss(self, current_log_probs, log_probs, A, entropy):
@@ -33,35 +33,47 @@ class PPO(ActorCritic):
     def get_critic_loss(self, V, rewards, discounted_return):
         return self.mse(V, discounted_return)
 
-    def learn(self, states, next_states, actions, log_probs, rewards, dones, discounted_return):
+    def learn(self, states, next_states, actions, log_probs, values, next_values, rewards, dones, discounted_return):
 
         # Calculate Advantage
-        A = self.get_advantage(states, next_states, actions, dones, discounted_return)
-        
+        A = self.get_advantage(values, next_values, rewards, dones, discounted_return)
+
+        # batches without a fixed horizon hold the last episodes beyond batch_size, all steps are trained on
+        return self.update_model(*self.shard(len(states), states, actions, log_probs, A, rewards, discounted_return))
+
+    def update_model(self, states, actions, log_probs, A, rewards, discounted_return):
+        # data parallel learners split the batch and the minibatches
+        world_size      = distributed.get_world_size()
+        batch_size      = len(states)
+        mini_batch_size = max(1, self.args.mini_batch_size // world_size)
+        minibatches     = batch_size // mini_batch_size
+
+        if len(self.batch_indices) < batch_size:
+            self.batch_indices = torch.arange(batch_size, device=self.args.device)
+
         # default at 5 updates per iteration
         for _ in range(self.args.ppo_episodes):
 
             if self.args.shuffle_mini_batch:
-                # Shuffle batch indices
-                np.random.shuffle(self.batch_indices)
-
-            # Iterate over minibatches
-            for minibatch in range(self.minibatches):
-                
-                # Pick indices for minibatch
-                i_start = minibatch       * self.args.mini_batch_size
-                i_stop  = (minibatch + 1) * self.args.mini_batch_size
-                indices = self.batch_indices[i_start: i_stop]
-
-                # Evaluate state and actions to calculate V_phi and pi_theta(a_t | s_t)
-                V, current_log_probs, entropy = self.model.evaluate(states[indices], actions[indices])
-                
-                # Calculate actor and critic loss
-                actor_loss  = self.get_actor_loss(current_log_probs, log_probs[indices], A[indices], entropy)
-                critic_loss = self.get_critic_loss(V, rewards[indices], discounted_return[indices]) 
+                # Shuffle batch indices on the device of the batch
+                batch_indices = torch.randperm(batch_size, device=self.args.device)
+            else:
+                batch_indices = self.batch_indices[:batch_size]
+
+            # Iterate over minibatches, the indices of every minibatch are views of the permutation
+            used = minibatches * mini_batch_size
+            for indices in batch_indices[:used].split(mini_batch_size):
+
+                with self.args.timers.phase("Evaluate"):
+                    # Evaluate state and actions to calculate V_phi and pi_theta(a_t | s_t)
+                    V, current_log_probs, entropy = self.model.evaluate(states[indices], actions[indices])
+
+                    # Calculate actor and critic loss
+                    actor_loss  = self.get_actor_loss(current_log_probs, log_probs[indices], A[indices], entropy)
+                    critic_loss = self.get_critic_loss(V, rewards[indices], discounted_return[indices])
 
                 # Calculate gradients and perform backward propagation
                 self.model.optimize(actor_loss, critic_loss)
 
 
-        return actor_loss, critic_loss, entropy
\ No newline at end of file
+        return actor_loss.item(), critic_loss.item(), entropy.item()
\ No newline at end of file
@@ -0,0 +1,145 @@
+import argparse
+import random
+import math
+import time
+
+import numpy as np
+import torch
+
+import commandline
+import environment
+import timing
+from buffer import RolloutBuffer
+from sampler import refresh_values
+
+
+class RolloutWorker:
+    # Ray actor with its own environments and copy of the policy, it returns the compact
+    # [time, env] arrays of its buffer, the learner merges them into a single batch
+    def __init__(self, settings, worker_id, seed=None):
+        from ppo import PPO
+        from a2c import A2C
+
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+            torch.manual_seed(seed)
+
+        args = argparse.Namespace(**settings)
+        args.device = torch.device("cpu")
+        args.timers = timing.Timers()
+        args.episode = 0
+        args.env = environment.create_vector_env(args.env_name, args.num_envs, no_graphics=True,
+                                                 backend=args.env_backend, worker_id=worker_id,
+                                                 time_scale=args.time_scale)
+        self.agent = PPO(args) if args.algorithm in ["ppo", "appo"] else A2C(args)
+
+        # the buffer is created by the first rollout, after the learner checked the number of environments
+        self.buffer = None
+
+    def get_num_envs(self):
+        # unity scenes define their own number of environments
+        return self.agent.args.env.num_envs
+
+    def rollout(self, weights, episode):
+        # weights of the learner are resolved from the object store by ray
+        actor, critic = weights
+        model = self.agent.model
+        model.actor.load_state_dict(actor)
+        model.critic.load_state_dict(critic)
+
+        # the noise follows the steps of the learner
+        self.agent.args.episode = episode
+        if self.buffer is None:
+            self.buffer = self.agent.create_buffer()
+
+        start = time.perf_counter()
+        sum_rewards = self.agent.collect(model, self.buffer)
+        return self.buffer.get_trajectories(), sum_rewards, time.perf_counter() - start
+
+    def close(self):
+        self.agent.args.env.close()
+
+
+class RaySampler:
+    # Distributes the rollout over ray actors, has the interface of the AsyncSampler.
+    # The workers collect the next batch with the new weights after release, with
+    # --async_rollout they collect it during the update with the weights of the last batch.
+    def __init__(self, agent, num_workers, address=None):
+        # ray is only imported if the rollout is distributed
+        import ray
+        self.ray = ray
+        if not ray.is_initialized():
+            # without an address a local cluster is started
+            ray.init(address=address)
+
+        self.agent = agent
+        args = agent.args
+
+        # every worker collects its share of the batch
+        settings = commandline.get_settings(args)
+        settings["batch_size"] = math.ceil(args.batch_size / num_workers)
+
+        # unity instances of the workers follow the environments of the trainer
+        worker = ray.remote(RolloutWorker)
+        self.workers = [worker.remote(settings, args.worker_id + (i + 1) * args.num_envs,
+                                      None if args.seed is None else args.seed + i + 1)
+                        for i in range(num_workers)]
+
+        # the merged buffer places the environments of all workers side by side
+        num_envs = ray.get([worker.get_num_envs.remote() for worker in self.workers])
+        if args.fixed_horizon and any(settings["batch_size"] % envs != 0 for envs in num_envs):
+            self.close()
+            raise Exception("batch_size / ray_workers ({}) has to be a multiple of the environments of every "
+                            "worker ({}) with --fixed_horizon".format(settings["batch_size"], num_envs))
+        self.buffer = RolloutBuffer(1, sum(num_envs), args.state_dim, args.act_dim)
+        self.steps_per_second = [0.] * num_workers
+
+        # Number of learner updates, the policy lag of a batch is measured in updates
+        self.version = 0
+        self.pending = None
+        self.launch()
+
+    def launch(self):
+        # the weights are put once into the object store and shared by all workers
+        weights = self.ray.put([{name: value.detach().cpu().clone() for name, value in net.state_dict().items()}
+                                for net in [self.agent.model.actor, self.agent.model.critic]])
+        self.pending = self.version, [worker.rollout.remote(weights, self.agent.args.episode) for worker in self.workers]
+
+    def get(self):
+        version, futures = self.pending
+        results = self.ray.get(futures)
+        self.pending = None
+        if self.agent.args.async_rollout:
+            self.launch()
+
+        parts, sum_rewards = [], []
+        for i, (trajectories, rewards, seconds) in enumerate(results):
+            steps = int(trajectories["lengths"].sum())
+            self.steps_per_second[i] = steps / seconds
+            self.agent.args.episode += steps
+            parts.append(trajectories)
+            sum_rewards.extend(rewards)
+
+        # advantages and GAE unflatten the batch with the merged buffer
+        self.buffer.merge(parts)
+        self.agent.buffer = self.buffer
+        batch = self.agent.get_batch(self.buffer, sum_rewards)
+
+        lag = self.version - version
+        if lag > 0:
+            batch = refresh_values(self.agent, batch)
+        return batch, lag
+
+    def release(self):
+        # the learner finished the current batch
+        self.version += 1
+        if self.pending is None:
+            self.launch()
+
+    def close(self):
+        # the environments are closed before the actors are stopped
+        self.ray.get([worker.close.remote() for worker in self.workers])
+        for worker in self.workers:
+            self.ray.kill(worker)
+        self.workers = []
@@ -0,0 +1,30 @@
+def reverse_scan(x, coef):
+    # Solves y[t] = x[t] + coef[t] * y[t + 1] along the first axis with a
+    # log-depth (Hillis-Steele) scan of whole array operations.
+    # Works for numpy arrays and torch tensors of shape [time] or [time, env].
+    y = x * 1
+    a = coef * 1
+    shift = 1
+    while shift < len(y):
+        y[:-shift] = y[:-shift] + a[:-shift] * y[shift:]
+        a[:-shift] = a[:-shift] * a[shift:]
+        shift *= 2
+    return y
+
+
+def discount(rewards, dones, gamma, bootstrap=None):
+    # Discounted return which restarts after every done.
+    # bootstrap holds the value of the next state where a trajectory was cut off
+    # (time limit or end of the batch) and 0 everywhere else.
+    if bootstrap is not None:
+        rewards = rewards + gamma * bootstrap
+    return reverse_scan(rewards, gamma * (1 - dones))
+
+
+def gae(rewards, values, next_values, dones, gamma, lam, terminals=None):
+    # Generalized advantage estimation, dones end the accumulation while only
+    # terminals (default: dones) drop the value of the next state
+    if terminals is None:
+        terminals = dones
+    deltas = rewards + gamma * next_values * (1 - terminals) - values
+    return reverse_scan(deltas, gamma * lam * (1 - dones))
@@ -0,0 +1,99 @@
+import threading
+import queue
+
+import torch
+
+
+def refresh_values(agent, batch):
+    # value estimates of the behaviour policy are outdated, the critic only path is cheap
+    states, next_states, actions, log_probs, values, next_values, rewards, dones, sum_rewards, discounted_return = batch
+    values      = agent.model.value(states)
+    next_values = agent.model.value(next_states)
+
+    # next states of the batch are the shifted states, the observations which ended an episode are evaluated apart
+    rows, terminal_states = agent.buffer.get_terminal_states()
+    if len(rows) > 0:
+        next_values[torch.from_numpy(rows).to(next_values.device)] = agent.model.value(terminal_states)
+    return states, next_states, actions, log_probs, values, next_values, rewards, dones, sum_rewards, discounted_return
+
+
+class AsyncSampler:
+    def __init__(self, agent):
+        self.agent = agent
+
+        # The sampler acts with its own copy of the policy
+        self.model = agent.create_model()
+
+        # Double buffered batches, the sampler fills one while the learner trains on the other
+        self.free = queue.Queue()
+        for _ in range(2):
+            self.free.put(agent.create_buffer())
+        self.batches = queue.Queue(maxsize=1)
+        self.current = None
+
+        # Number of learner updates, the policy lag of a batch is measured in updates
+        self.version = 0
+        self.lock = threading.Lock()
+        self.publish()
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def publish(self):
+        # snapshot of the learner weights which is loaded before every rollout
+        weights = [{name: value.detach().clone() for name, value in net.state_dict().items()}
+                   for net in [self.agent.model.actor, self.agent.model.critic]]
+        with self.lock:
+            self.weights = self.version, weights
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                buffer = self.free.get()
+                if buffer is None:
+                    break
+
+                with self.lock:
+                    version, (actor, critic) = self.weights
+                self.model.actor.load_state_dict(actor)
+                self.model.critic.load_state_dict(critic)
+
+                # the steps are counted by get, args.episode belongs to the learner
+                sum_rewards = self.agent.collect(self.model, buffer)
+                batch = self.agent.get_batch(buffer, sum_rewards)
+                self.batches.put((batch, buffer, version))
+        except Exception as e:
+            self.batches.put(e)
+
+    def get(self):
+        item = self.batches.get()
+        if isinstance(item, Exception):
+            raise item
+        batch, self.current, version = item
+        self.agent.args.episode += len(batch[0])
+
+        # advantages and GAE unflatten the batch with the buffer it was collected in
+        self.agent.buffer = self.current
+        lag = self.version - version
+
+        if lag > 0:
+            batch = refresh_values(self.agent, batch)
+
+        return batch, lag
+
+    def release(self):
+        # the learner finished the current batch
+        self.version += 1
+        self.publish()
+        self.free.put(self.current)
+        self.current = None
+
+    def close(self):
+        self.stopped.set()
+
+        # unblock the sampler if it waits for the learner
+        while not self.batches.empty():
+            self.batches.get_nowait()
+        self.free.put(None)
+        self.thread.join()
@@ -1,10 +1,70 @@
-import mlflow
+import threading
+import time
 
-def mlflow_logging(params, metrics, experiment):
-    """experiment should be specified in args.experiment"""
+# limits of a single log_batch request
+MAX_METRICS = 1000
+MAX_PARAMS  = 100
 
-    mlflow.set_tracking_uri("http://159.65.120.229:5000")
-    mlflow.set_experiment(experiment)
 
-    mlflow.log_metrics(metrics)
-    mlflow.log_params(params)
\ No newline at end of file
+class MlflowSink:
+    """Buffers params and metrics and sends them with log_batch from a background thread.
+
+    tracking_uri is a local file store (e.g. file:./mlruns) or a tracking server, the
+    training loop never waits for it. Failed requests are reported and dropped.
+    """
+
+    def __init__(self, tracking_uri, experiment, run_name=None, interval=10.):
+        # mlflow is only imported if metrics are tracked
+        from mlflow.tracking import MlflowClient
+        from mlflow.entities import Metric, Param
+        self.Metric, self.Param = Metric, Param
+
+        self.client = MlflowClient(tracking_uri)
+        found = self.client.get_experiment_by_name(experiment)
+        experiment_id = found.experiment_id if found is not None else self.client.create_experiment(experiment)
+        tags = {"mlflow.runName": run_name} if run_name is not None else {}
+        self.run_id = self.client.create_run(experiment_id, tags=tags).info.run_id
+
+        self.metrics = []
+        self.params = []
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def log_params(self, params):
+        with self.lock:
+            self.params.extend(self.Param(name, str(value)) for name, value in params.items())
+
+    def log_metrics(self, metrics, step):
+        timestamp = int(time.time() * 1000)
+        with self.lock:
+            self.metrics.extend(self.Metric(name, float(value), timestamp, step) for name, value in metrics.items())
+
+    def run(self):
+        while not self.closed.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            metrics, self.metrics = self.metrics, []
+            params, self.params = self.params, []
+
+        try:
+            for i in range(0, len(metrics), MAX_METRICS):
+                self.client.log_batch(self.run_id, metrics=metrics[i:i + MAX_METRICS], params=[])
+            for i in range(0, len(params), MAX_PARAMS):
+                self.client.log_batch(self.run_id, metrics=[], params=params[i:i + MAX_PARAMS])
+        except Exception as e:
+            print("mlflow logging failed: {}".format(e))
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        self.flush()
+        try:
+            self.client.set_terminated(self.run_id)
+        except Exception as e:
+            print("mlflow logging failed: {}".format(e))
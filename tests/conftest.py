@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+import torch
+
+# the modules of the trainer live in the root of the repository
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import commandline
+import timing
+
+
+@pytest.fixture
+def args():
+    # default settings of the trainer with small synthetic dimensions
+    args = commandline.collect_arguments([])
+    args.device    = torch.device("cpu")
+    args.state_dim = 8
+    args.act_dim   = 3
+    args.episode   = 0
+    args.timers    = timing.Timers()
+    return args
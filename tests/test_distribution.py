@@ -0,0 +1,21 @@
+import pytest
+import torch
+from torch.distributions import MultivariateNormal
+
+from model import Model, AdvancedModel, SharedModel
+
+
+@pytest.mark.parametrize("model_class", [Model, AdvancedModel, SharedModel])
+def test_diagonal_distribution_matches_multivariate(args, model_class):
+    # the independent normals have to give the log probs and entropy of the full covariance
+    torch.manual_seed(0)
+    model   = model_class(args)
+    states  = torch.randn(64, args.state_dim)
+    base    = model.get_base(states)
+    dist    = model.get_distribution(base)
+    full    = MultivariateNormal(model.get_mean(base), model.get_covmat(base))
+    actions = full.sample()
+
+    assert model.diagonal
+    assert torch.allclose(dist.log_prob(actions), full.log_prob(actions), rtol=1e-5, atol=1e-5)
+    assert torch.allclose(dist.entropy(), full.entropy().expand(len(states)), rtol=1e-5, atol=1e-5)
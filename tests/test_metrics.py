@@ -0,0 +1,40 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from metrics import MetricsLog, load_metrics
+from model import Model, AdvancedModel
+
+
+@pytest.mark.parametrize("model_class", [Model, AdvancedModel])
+def test_load_pickled_logger(args, model_class, tmp_path):
+    # checkpoints of runs before the metrics file pickled the logger with the losses as tensors,
+    # --load has to turn them into a history row of the metrics file
+    model = model_class(args)
+    checkpoint_path = str(tmp_path / "checkpoint")
+    model.actor.save(checkpoint_path + "_actor.nn")
+    model.critic.save(checkpoint_path + "_critic.nn")
+    old_logger = {
+        "Total Reward":   [np.float64(-10.5), np.float64(3.25)],
+        "Average Reward": [np.float64(-3.625)],
+        "Std":            [np.float64(6.875)],
+        "Actor Loss":     [torch.tensor(0.5, requires_grad=True) * 1],
+        "Critic Loss":    [torch.tensor(12.)],
+        "Avg Std":        [np.float64(0.)],
+        "Entropy":        [torch.tensor(9.65)],
+    }
+    with open(checkpoint_path + "_data.log", "wb") as f:
+        pickle.dump(old_logger, f)
+
+    logger = {name: [] for name in old_logger}
+    model.load(checkpoint_path, logger)
+    assert all(type(value) is float for values in logger.values() for value in values)
+    assert logger["Actor Loss"] == [0.5] and logger["Total Reward"] == [-10.5, 3.25]
+
+    metrics = MetricsLog(os.path.join(tmp_path, "metrics.ndjson"))
+    metrics.append(0, logger)
+    metrics.close()
+    assert load_metrics(os.path.join(tmp_path, "metrics.ndjson")) == logger
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+import torch
+
+import policy
+from model import Model, AdvancedModel
+
+
+@pytest.mark.parametrize("model_class", [Model, AdvancedModel])
+@pytest.mark.parametrize("float16, tolerance", [(False, 1e-5), (True, 1e-2)])
+def test_numpy_policy_matches_model(args, model_class, float16, tolerance, tmp_path):
+    # the numpy runtime has to give the actions of the torch model
+    torch.manual_seed(0)
+    model = model_class(args)
+
+    # the heads of new actors are initialized close to zero, random weights test all layers
+    with torch.no_grad():
+        for parameter in model.actor.parameters():
+            parameter.normal_(0, 0.3)
+    states = torch.randn(256, args.state_dim)
+    with torch.no_grad():
+        base = model.get_base(states)
+        mean, variance = model.get_mean(base), model.get_variance(base).expand(len(states), args.act_dim)
+
+    path = str(tmp_path / "policy.npz")
+    policy.export_model(model, path, float16)
+    runtime = policy.NumpyPolicy(path, seed=0)
+    base = runtime.get_base(states.numpy())
+    assert np.allclose(runtime.get_mean(base), mean.numpy(), atol=tolerance)
+    assert np.allclose(np.broadcast_to(runtime.get_variance(base), variance.shape), variance.numpy(), atol=tolerance)
+    assert np.allclose(runtime.act(states.numpy(), deterministic=True), mean.numpy(), atol=tolerance)
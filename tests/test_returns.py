@@ -0,0 +1,90 @@
+import numpy as np
+import torch
+
+import returns
+from benchmark import reference_discount, create_trajectories
+
+GAMMA  = 0.995
+LAMBDA = 0.95
+
+
+def reference_gae(rewards, values, next_values, dones, gamma, lam):
+    running = 0
+    advantages = np.zeros(len(rewards), dtype=np.float64)
+    for i in reversed(range(len(rewards))):
+        delta = rewards[i] + gamma * next_values[i] * (1 - dones[i]) - values[i]
+        running = delta + gamma * lam * (1 - dones[i]) * running
+        advantages[i] = running
+    return advantages
+
+
+def reference_bootstrap(rewards, dones, terminals, bootstrap, gamma):
+    # return of cut trajectories starts with the value of the next state, terminals start with 0
+    running = 0
+    discounted = np.zeros(len(rewards))
+    for i in reversed(range(len(rewards))):
+        if dones[i]:
+            running = 0 if terminals[i] else bootstrap[i]
+        running = rewards[i] + gamma * running
+        discounted[i] = running
+    return discounted
+
+
+def test_discount_matches_loop():
+    rewards, _, _, dones = create_trajectories(5000, 50)
+    expected = reference_discount(rewards.tolist(), dones.tolist(), GAMMA).numpy()
+    assert np.allclose(returns.discount(rewards, dones, GAMMA), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_discount_torch_matches_numpy():
+    rewards, _, _, dones = create_trajectories(5000, 50)
+    result = returns.discount(torch.from_numpy(rewards), torch.from_numpy(dones), GAMMA)
+    assert torch.is_tensor(result)
+    assert np.allclose(result.numpy(), returns.discount(rewards, dones, GAMMA), rtol=1e-5, atol=1e-5)
+
+
+def test_gae_matches_loop():
+    rewards, values, next_values, dones = create_trajectories(5000, 50)
+    expected = reference_gae(rewards, values, next_values, dones, GAMMA, LAMBDA)
+    assert np.allclose(returns.gae(rewards, values, next_values, dones, GAMMA, LAMBDA), expected,
+                       rtol=1e-4, atol=1e-4)
+
+
+def test_time_env_layout_scans_every_environment():
+    rewards, values, next_values, dones = create_trajectories(4000, 50)
+    layout = (500, 8)
+    rewards, values, next_values, dones = [x.reshape(layout) for x in [rewards, values, next_values, dones]]
+
+    discounted = returns.discount(rewards, dones, GAMMA)
+    advantages = returns.gae(rewards, values, next_values, dones, GAMMA, LAMBDA)
+    for env in range(layout[1]):
+        assert np.allclose(discounted[:, env], returns.discount(rewards[:, env], dones[:, env], GAMMA))
+        assert np.allclose(advantages[:, env], reference_gae(rewards[:, env], values[:, env], next_values[:, env],
+                                                             dones[:, env], GAMMA, LAMBDA), rtol=1e-4, atol=1e-4)
+
+
+def test_bootstrap_at_truncations():
+    rewards, values, next_values, dones = create_trajectories(2000, 50)
+    rng = np.random.RandomState(1)
+    terminals = dones * (rng.rand(len(dones)) < 0.5)
+    bootstrap = np.where((dones > 0) & (terminals == 0), next_values, 0).astype(np.float32)
+
+    expected = reference_bootstrap(rewards, dones, terminals, bootstrap, GAMMA)
+    assert np.allclose(returns.discount(rewards, dones, GAMMA, bootstrap), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_gae_keeps_the_next_value_of_truncations():
+    rewards, values, next_values, dones = create_trajectories(2000, 50)
+    rng = np.random.RandomState(1)
+    terminals = dones * (rng.rand(len(dones)) < 0.5)
+
+    # a truncation ends the accumulation but keeps gamma * V(s') in its delta
+    expected = np.zeros(len(rewards))
+    running = 0
+    for i in reversed(range(len(rewards))):
+        delta = rewards[i] + GAMMA * next_values[i] * (1 - terminals[i]) - values[i]
+        running = delta + GAMMA * LAMBDA * (1 - dones[i]) * running
+        expected[i] = running
+
+    result = returns.gae(rewards, values, next_values, dones, GAMMA, LAMBDA, terminals)
+    assert np.allclose(result, expected, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,136 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+import environment
+
+
+class FakeSteps:
+    # DecisionSteps / TerminalSteps of the mlagents_envs step interface, the observation is split in two sensors
+    def __init__(self, agent_ids, observations, rewards, state_dim, interrupted=None):
+        self.agent_id = np.array(agent_ids, dtype=int)
+        observations = np.array(observations, dtype=np.float32).reshape(len(self.agent_id), state_dim)
+        self.obs = [observations[:, :-4], observations[:, -4:]]
+        self.reward = np.array(rewards, dtype=np.float32)
+        if interrupted is None:
+            interrupted = [False] * len(self.agent_id)
+        self.interrupted = np.array(interrupted, dtype=bool)
+
+    def __len__(self):
+        return len(self.agent_id)
+
+
+class FakeUnityEnv:
+    # Scene with one agent per entry of periods. Agent i requests a decision every periods[i] steps,
+    # so the other agents are stepped without a decision. Episodes of agent i end after episode_lengths[i]
+    # steps, by the max step of the agent if interrupted[i]. The observations are filled with
+    # 100 * episode + step of the agent.
+    def __init__(self, periods=(1, 1, 2, 1, 3), episode_lengths=(7, 5, 6, 7, 4),
+                 interrupted=(True, False, False, True, False), state_dim=64, act_dim=9):
+        self.periods = periods
+        self.episode_lengths = np.array(episode_lengths)
+        self.interrupted = np.array(interrupted)
+        self.state_dim = state_dim
+        self.act_dim = act_dim
+        self.behavior_specs = {"Worm?team=0": SimpleNamespace(
+            observation_specs=[SimpleNamespace(shape=(state_dim - 4,)), SimpleNamespace(shape=(4,))],
+            action_spec=SimpleNamespace(continuous_size=act_dim))}
+        self.steps = 0
+
+    def observe(self, i):
+        return np.full(self.state_dim, 100 * self.episodes[i] + self.t[i], dtype=np.float32)
+
+    def reset(self):
+        self.t = np.zeros(len(self.periods), dtype=int)
+        self.episodes = np.zeros(len(self.periods), dtype=int)
+        self.decisions = list(range(len(self.periods)))
+        self.terminals = []
+
+    def get_steps(self, behavior_name):
+        decision_steps = FakeSteps(self.decisions, [self.observe(i) for i in self.decisions],
+                                   [1.] * len(self.decisions), self.state_dim)
+        terminal_ids = [i for i, _ in self.terminals]
+        terminal_steps = FakeSteps(terminal_ids, [state for _, state in self.terminals],
+                                   [10.] * len(self.terminals), self.state_dim, self.interrupted[terminal_ids])
+        return decision_steps, terminal_steps
+
+    def set_actions(self, behavior_name, action):
+        assert action.continuous.shape == (len(self.decisions), self.act_dim)
+
+    def step(self):
+        self.steps += 1
+        self.decisions, self.terminals = [], []
+        for i, period in enumerate(self.periods):
+            self.t[i] += 1
+            if self.t[i] >= self.episode_lengths[i]:
+                # unity restarts the agent, it requests the first decision of its next episode
+                self.terminals.append((i, self.observe(i)))
+                self.episodes[i] += 1
+                self.t[i] = 0
+                self.decisions.append(i)
+            elif self.steps % period == 0:
+                self.decisions.append(i)
+
+    def close(self):
+        pass
+
+
+def run_scene(steps=30):
+    # vector env of the fake scene, every finished environment is reset after the step
+    fake = FakeUnityEnv()
+    env = environment.UnityVectorEnv(fake)
+    episodes = np.zeros(env.num_envs, dtype=int)
+    actions = np.zeros((env.num_envs, fake.act_dim), dtype=np.float32)
+    env.reset()
+    for _ in range(steps):
+        states, rewards, dones, truncated = env.step(actions)
+        yield fake, episodes, states, rewards, dones, truncated
+        finished = np.nonzero(dones)[0]
+        env.reset(finished)
+        episodes[finished] += 1
+
+
+def test_reset_observes_every_agent():
+    fake = FakeUnityEnv()
+    env = environment.UnityVectorEnv(fake)
+    states = env.reset()
+    assert env.num_envs == len(fake.periods)
+    assert states.shape == (env.num_envs, fake.state_dim) and np.all(states == 0)
+
+
+def test_done_returns_the_terminal_observation():
+    for fake, episodes, states, rewards, dones, _ in run_scene():
+        steps = states[:, 0] % 100
+        assert np.all(states[dones, 0] // 100 == episodes[dones])
+        assert np.all(steps[dones] == fake.episode_lengths[dones]) and np.all(rewards[dones] >= 10)
+        assert np.all(steps[~dones] < fake.episode_lengths[~dones])
+
+
+def test_interrupted_episodes_are_truncated():
+    # episodes which reached the max step of the agent are truncated
+    for fake, _, _, _, dones, truncated in run_scene():
+        assert np.all(truncated == (dones & fake.interrupted))
+
+
+def test_reset_of_single_environments():
+    # a reset of single environments starts their next episode and keeps the others running
+    fake = FakeUnityEnv()
+    env = environment.UnityVectorEnv(fake)
+    episodes = np.zeros(env.num_envs, dtype=int)
+    actions = np.zeros((env.num_envs, fake.act_dim), dtype=np.float32)
+    env.reset()
+    for _ in range(30):
+        states, _, dones, _ = env.step(actions)
+        finished = np.nonzero(dones)[0]
+        running = np.nonzero(~dones)[0][:1]
+        reset_states = env.reset(np.concatenate([finished, running]))
+        episodes[finished] += 1
+        assert np.all(reset_states[:len(finished), 0] // 100 == episodes[finished])
+        assert np.all(reset_states[len(finished):] == states[running])
+
+
+def test_agents_without_decision_are_stepped():
+    # agents with a longer decision period made unity step more often than the vector env
+    for fake, episodes, *_ in run_scene():
+        pass
+    assert fake.steps > 30 and np.all(episodes > 0) and len(set(episodes)) > 1
@@ -0,0 +1,98 @@
+import contextlib
+import threading
+import time
+import os
+
+import torch
+
+# phases of a batch, every phase is logged as column "Time <phase>" in seconds per batch
+PHASES = ["Rollout", "Inference", "Env Step", "Buffer", "Learn", "Advantage", "Evaluate", "Optimize", "Checkpoint", "Plot"]
+
+
+class Timers:
+    def __init__(self):
+        # the asynchronous sampler measures its phases in its own thread
+        self.lock = threading.Lock()
+        self.totals = dict.fromkeys(PHASES, 0.0)
+
+        # phases are labeled in the trace while the torch profiler runs
+        self.record = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            if self.record:
+                with torch.autograd.profiler.record_function(name):
+                    yield
+            else:
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.totals[name] += elapsed
+
+    def pop(self):
+        # seconds spent in every phase since the last call
+        with self.lock:
+            totals, self.totals = self.totals, dict.fromkeys(PHASES, 0.0)
+        return totals
+
+
+def get_rss():
+    # resident memory of the trainer in MB
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        # peak instead of current memory where /proc is not available
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+class Profiler:
+    # profiles a window of batches with torch.profiler or cProfile, the traces are stored in the run folder
+    def __init__(self, kind, folder, timers):
+        if kind not in ["torch", "cprofile"]:
+            raise NotImplementedError
+        self.kind = kind
+        self.folder = folder
+        self.timers = timers
+        self.profiler = None
+
+    def start(self):
+        if self.kind == "torch":
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+            self.profiler.start()
+            self.timers.record = True
+        else:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is None:
+            return
+
+        if self.kind == "torch":
+            self.timers.record = False
+            self.profiler.stop()
+            self.profiler.export_chrome_trace(os.path.join(self.folder, "profile_trace.json"))
+            table = self.profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=50)
+            with open(os.path.join(self.folder, "profile.txt"), "w") as f:
+                f.write(table)
+        else:
+            import pstats
+            self.profiler.disable()
+            self.profiler.dump_stats(os.path.join(self.folder, "profile.prof"))
+            with open(os.path.join(self.folder, "profile.txt"), "w") as f:
+                pstats.Stats(self.profiler, stream=f).sort_stats("cumulative").print_stats(50)
+
+        self.profiler = None
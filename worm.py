@@ -0,0 +1,140 @@
+import numpy as np
+
+# shapes and episode length of the unity worms
+STATE_DIM = 64
+ACT_DIM   = 9
+MAX_STEP  = 1000
+
+
+class Box:
+    # continuous space with the attributes of gym.spaces.Box used by the trainer
+    def __init__(self, low, high, shape, dtype=np.float32):
+        self.low   = np.full(shape, low, dtype=dtype)
+        self.high  = np.full(shape, high, dtype=dtype)
+        self.shape = shape
+        self.dtype = dtype
+
+    def sample(self):
+        return np.random.uniform(self.low, self.high).astype(self.dtype)
+
+
+class BatchedWorm:
+    # Stand-in for the unity worms with vectorized numpy dynamics.
+    # Every instance has 9 driven joints and a torso which is pushed forward by the joints
+    # in ground contact, the reward is the velocity towards a target like in the worm envs.
+    # The api is the one of VectorEnv, so the rollout steps all instances in one call.
+    # Episodes only end by the time limit, so every done is also truncated.
+    dt = 0.05
+
+    def __init__(self, num_envs, seed=0, max_step=MAX_STEP):
+        self.num_envs = num_envs
+        self.max_step = max_step
+        self.rng = np.random.RandomState(seed)
+
+        self.observation_space = Box(-np.inf, np.inf, (STATE_DIM,))
+        self.action_space      = Box(-1, 1, (ACT_DIM,))
+
+        # fixed coupling of joint movement to the thrust of the torso
+        self.coupling = np.random.RandomState(0).randn(ACT_DIM, 3) / ACT_DIM
+        self.coupling[:, 2] *= 0.1
+        self.phase = np.linspace(0, np.pi, ACT_DIM)
+
+        self.angles     = np.zeros((num_envs, ACT_DIM))
+        self.velocities = np.zeros((num_envs, ACT_DIM))
+        self.actions    = np.zeros((num_envs, ACT_DIM))
+        self.position   = np.zeros((num_envs, 3))
+        self.velocity   = np.zeros((num_envs, 3))
+        self.target     = np.zeros((num_envs, 3))
+        self.t          = np.zeros(num_envs, dtype=int)
+
+    def get_indices(self, indices):
+        return np.arange(self.num_envs) if indices is None else indices
+
+    def place_target(self, indices):
+        # targets are placed on the ground 10 units away
+        angle = self.rng.uniform(0, 2 * np.pi, len(indices))
+        self.target[indices] = self.position[indices] + 10 * np.stack([np.cos(angle), np.sin(angle), np.zeros_like(angle)], 1)
+
+    def observe(self, indices):
+        angles = self.angles[indices]
+        contact = np.sin(angles + self.phase) < 0
+
+        direction = self.target[indices] - self.position[indices]
+        direction /= np.linalg.norm(direction, axis=1, keepdims=True) + 1e-8
+
+        tilt = angles.mean(1)
+        up = np.stack([np.sin(tilt), np.zeros_like(tilt), np.cos(tilt)], 1)
+
+        return np.concatenate([
+            angles, self.velocities[indices], np.sin(angles), np.cos(angles), self.actions[indices], contact,
+            self.velocity[indices], direction, up, (self.t[indices] / self.max_step)[:, None]], 1).astype(np.float32)
+
+    def reset(self, indices=None):
+        indices = self.get_indices(indices)
+        self.angles[indices]     = self.rng.uniform(-0.1, 0.1, (len(indices), ACT_DIM))
+        self.velocities[indices] = 0
+        self.actions[indices]    = 0
+        self.position[indices]   = 0
+        self.velocity[indices]   = 0
+        self.t[indices]          = 0
+        self.place_target(indices)
+        return self.observe(indices)
+
+    def step(self, actions, indices=None):
+        indices = self.get_indices(indices)
+        actions = np.clip(np.asarray(actions, dtype=np.float64), -1, 1)
+
+        # joints are driven by the actions against a spring and damping
+        angles, velocities = self.angles[indices], self.velocities[indices]
+        velocities += self.dt * (20 * actions - 5 * angles - 2 * velocities)
+        angles += self.dt * velocities
+        np.clip(angles, -1.5, 1.5, out=angles)
+
+        # joints in ground contact push the torso
+        contact = np.sin(angles + self.phase) < 0
+        thrust = (contact * velocities) @ self.coupling
+        velocity = 0.9 * self.velocity[indices] + 0.1 * thrust
+        position = self.position[indices] + self.dt * velocity
+
+        self.angles[indices], self.velocities[indices], self.actions[indices] = angles, velocities, actions
+        self.position[indices], self.velocity[indices] = position, velocity
+        self.t[indices] += 1
+
+        # velocity towards the target with a small energy cost
+        direction = self.target[indices] - position
+        distance = np.linalg.norm(direction, axis=1)
+        rewards = (velocity * direction).sum(1) / (distance + 1e-8) - 0.01 * (actions ** 2).sum(1)
+
+        # reached targets are replaced like in the dynamic worm
+        reached = indices[distance < 1]
+        if len(reached) > 0:
+            self.place_target(reached)
+
+        truncated = self.t[indices] >= self.max_step
+        return self.observe(indices), rewards, truncated, truncated.copy()
+
+    def close(self):
+        pass
+
+
+class WormEnv:
+    # single worm with the gym api
+    def __init__(self, seed=0, max_step=MAX_STEP):
+        self.worm = BatchedWorm(1, seed, max_step)
+        self.observation_space = self.worm.observation_space
+        self.action_space      = self.worm.action_space
+
+    def reset(self):
+        return self.worm.reset()[0]
+
+    def step(self, action):
+        states, rewards, dones, truncated = self.worm.step(np.asarray(action)[None])
+        # time limit flag of gym's TimeLimit wrapper
+        info = {"TimeLimit.truncated": True} if truncated[0] else {}
+        return states[0], float(rewards[0]), bool(dones[0]), info
+
+    def render(self, mode="human"):
+        pass
+
+    def close(self):
+        self.worm.close()